@@ -31,9 +31,17 @@ def colnum_to_excel_col(n):
         n = n // 26 - 1
     return col
 
+def read_retained_columns(file_path):
+    """Read only the COLUMN_ORDER + CREATED_COLUMNS columns, all as text (no float round-trip)."""
+    with open(file_path, "r", encoding="utf-8-sig", newline="") as f:
+        header = next(csv.reader(f, delimiter="\t"), [])
+    keep = set(COLUMN_ORDER + CREATED_COLUMNS)
+    usecols = [col for col in header if col in keep]
+    return pd.read_csv(file_path, sep='\t', usecols=usecols, dtype=str, encoding="utf-8-sig")
+
 def process_file(file_path):
     try:
-        df = pd.read_csv(file_path, sep='\t', low_memory=False)
+        df = read_retained_columns(file_path)
     except Exception as e:
         print(f"❌ Failed to read '{file_path}': {e}")
         return
@@ -0,0 +1,213 @@
+import os
+import sys
+import csv
+import re
+import argparse
+from datetime import datetime
+
+# ---------- Config ----------
+CHUNKSIZE = 100_000          # rows per Parquet record batch
+WRITE_BUFFER = 1 << 20       # bytes of write buffer per county file
+INPUT_ENCODING = "utf-8-sig" # tolerate a BOM from sheet/Excel exports
+INPUT_ERRORS = "replace"     # tolerate odd characters
+OUTPUT_NEWLINE = ""          # good CSV behavior on Windows
+# ----------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description=("Write one CoGe upload file per county from a reviewed Grouper sheet export "
+                     "(rows with REVIEW == NONE and InstitutionCount > 0).")
+    )
+    p.add_argument(
+        "csv_path",
+        nargs="?",
+        help="Path to the reviewed CSV/TSV (e.g. the 'To CoGe' sheet downloaded as CSV)"
+    )
+    p.add_argument(
+        "--format",
+        choices=["csv", "parquet"],
+        default="csv",
+        help="csv: <county>_Export.csv per county; parquet: Hive-partitioned county=<value>/ dataset"
+    )
+    p.add_argument(
+        "--out-dir",
+        help="Output folder (default: County_Exports_<timestamp> next to the input)"
+    )
+    p.add_argument("--status-col", default="REVIEW", help="Review status column (default: REVIEW)")
+    p.add_argument("--status", default="NONE", help="Status value to export (default: NONE)")
+    p.add_argument("--count-col", default="InstitutionCount", help="Institution count column (default: InstitutionCount)")
+    p.add_argument("--county-col", default="county", help="County column (default: county)")
+    return p.parse_args()
+
+def pick_csv_path(args):
+    """Get input path from CLI arg or prompt."""
+    if args.csv_path:
+        return args.csv_path
+    return input("Enter path to the reviewed CSV/TSV file: ").strip()
+
+def safe_county(s: str) -> str:
+    """County value as a file/folder name; 'Blank' when empty (same as the sheet export)."""
+    s = (s or "").strip()
+    s = re.sub(r'[\\/:*?"<>|]', "-", s)
+    return s if s else "Blank"
+
+def to_number(s: str) -> float:
+    """Number() semantics from the sheet tool: blank → 0, junk → NaN (never > 0)."""
+    s = (s or "").strip()
+    if s == "":
+        return 0.0
+    try:
+        return float(s)
+    except ValueError:
+        return float("nan")
+
+def find_column(header, name):
+    """Case-insensitive header lookup; exits when missing."""
+    lut = {h.strip().lower(): i for i, h in enumerate(header)}
+    idx = lut.get(name.strip().lower())
+    if idx is None:
+        print(f'Error: Required column "{name}" not found.')
+        sys.exit(1)
+    return idx
+
+def iter_export_rows(in_path, status_col, status_value, count_col, county_col):
+    """
+    Single streaming pass over the input.
+    Yields the header once, then (county, row) for every row that passes the filter.
+    """
+    ext = os.path.splitext(in_path)[1].lower()
+    delimiter = "\t" if ext == ".tsv" else ","
+
+    with open(in_path, "r", encoding=INPUT_ENCODING, errors=INPUT_ERRORS, newline="") as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        try:
+            header = next(reader)
+        except StopIteration:
+            print("Error: file is empty.")
+            sys.exit(1)
+
+        status_idx = find_column(header, status_col)
+        count_idx = find_column(header, count_col)
+        county_idx = find_column(header, county_col)
+        width = len(header)
+
+        yield header
+        for row in reader:
+            if len(row) < width:
+                row = row + [""] * (width - len(row))
+            if row[status_idx] != status_value:
+                continue
+            if not to_number(row[count_idx]) > 0:
+                continue
+            yield safe_county(row[county_idx]), row[:width]
+
+def export_csv_by_county(rows, header, out_dir):
+    """Write each county's rows to its own buffered CSV writer as they stream past."""
+    writers = {}
+    handles = []
+    counts = {}
+    try:
+        for county, row in rows:
+            w = writers.get(county)
+            if w is None:
+                out_f = open(os.path.join(out_dir, f"{county}_Export.csv"), "w",
+                             encoding="utf-8", newline=OUTPUT_NEWLINE, buffering=WRITE_BUFFER)
+                handles.append(out_f)
+                w = csv.writer(out_f, quoting=csv.QUOTE_ALL)
+                w.writerow(header)
+                writers[county] = w
+                counts[county] = 0
+            w.writerow(row)
+            counts[county] += 1
+    finally:
+        for out_f in handles:
+            out_f.close()
+    return counts
+
+def export_parquet_by_county(rows, header, county_col, out_dir):
+    """Write a Hive-partitioned Parquet dataset (county=<value>/...) from the same row stream."""
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError:
+        print("Error: --format parquet requires pyarrow (pip install pyarrow).")
+        sys.exit(1)
+
+    # Header names must be unique for a table schema
+    names = []
+    seen = {}
+    for h in header:
+        n = h if h not in seen else f"{h}_{seen[h]}"
+        seen[h] = seen.get(h, 0) + 1
+        names.append(n)
+    part_name = next((n for n in names if n.strip().lower() == county_col.strip().lower()), county_col)
+    names_out = names + [part_name] if part_name not in names else names
+    county_pos = names_out.index(part_name)
+    schema = pa.schema([(n, pa.string()) for n in names_out])
+    counts = {}
+
+    def batches():
+        buf = []
+        for county, row in rows:
+            if len(names_out) > len(row):
+                row = row + [county]
+            else:
+                row = list(row)
+                row[county_pos] = county
+            buf.append(row)
+            counts[county] = counts.get(county, 0) + 1
+            if len(buf) >= CHUNKSIZE:
+                yield pa.RecordBatch.from_arrays([pa.array(col, pa.string()) for col in zip(*buf)], schema=schema)
+                buf = []
+        if buf:
+            yield pa.RecordBatch.from_arrays([pa.array(col, pa.string()) for col in zip(*buf)], schema=schema)
+
+    ds.write_dataset(
+        batches(),
+        out_dir,
+        schema=schema,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([(part_name, pa.string())]), flavor="hive"),
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    return counts
+
+def export_by_county(in_path, fmt="csv", out_dir=None, status_col="REVIEW", status_value="NONE",
+                     count_col="InstitutionCount", county_col="county"):
+    if not os.path.isfile(in_path):
+        print(f"Error: file not found: {in_path}")
+        sys.exit(1)
+
+    if out_dir is None:
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        out_dir = os.path.join(os.path.dirname(in_path), f"County_Exports_{timestamp}")
+    os.makedirs(out_dir, exist_ok=True)
+
+    stream = iter_export_rows(in_path, status_col, status_value, count_col, county_col)
+    header = next(stream)
+
+    if fmt == "parquet":
+        counts = export_parquet_by_county(stream, header, county_col, out_dir)
+    else:
+        counts = export_csv_by_county(stream, header, out_dir)
+
+    if not counts:
+        print(f"No rows matched the filter ({status_value} + {count_col} > 0).")
+        return counts
+
+    print(f"\nDone. Wrote {sum(counts.values()):,} rows for {len(counts):,} counties to {out_dir}")
+    for county in sorted(counts, key=str.lower):
+        print(f"  {county}  —  {counts[county]:,} rows")
+    return counts
+
+def main():
+    args = parse_args()
+    in_path = pick_csv_path(args)
+    if not in_path:
+        print("No file provided.")
+        sys.exit(0)
+    export_by_county(in_path, args.format, args.out_dir, args.status_col, args.status,
+                     args.count_col, args.county_col)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import os
+import sys
+import argparse
+import pandas as pd
+
+# ---------- Config ----------
+CHUNKSIZE = 100_000          # original rows read per chunk
+JOIN_FIELD = "bels_location_id"
+KEY_FIELD = "Grouper_ID"
+# ----------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description=("Copy Grouper_ID values from a (possibly hand-edited) -key.csv back into the "
+                     "original CSV/TSV by bels_location_id.")
+    )
+    p.add_argument(
+        "original_path",
+        nargs="?",
+        help="Path to the original CSV or TSV file"
+    )
+    p.add_argument(
+        "key_path",
+        nargs="?",
+        help="Path to the -key file produced by grouper.py (.csv, .tsv, .parquet or .feather)"
+    )
+    p.add_argument(
+        "-o", "--output",
+        help="Output path (default: <original>-merged.<ext>)"
+    )
+    p.add_argument(
+        "--chunksize",
+        type=int,
+        default=CHUNKSIZE,
+        help=f"Rows of the original file read per chunk (default: {CHUNKSIZE:,})"
+    )
+    return p.parse_args()
+
+def pick_path(value, prompt):
+    """Get a path from a CLI arg or prompt."""
+    if value:
+        return value
+    return input(prompt).strip()
+
+def sep_for_path(path):
+    """Infer the delimiter from the file extension: .csv → comma, .tsv → tab."""
+    ext = os.path.splitext(path)[1].lower()
+    return '\t' if ext == '.tsv' else ',' if ext == '.csv' else None
+
+def read_key_table(key_path):
+    """
+    The bels_location_id and Grouper_ID columns of a .csv/.tsv key, or of a .parquet/.feather one
+    (grouper.py --output-format), as strings; any other extension is read as comma-separated.
+    """
+    ext = os.path.splitext(key_path)[1].lower()
+    if ext in (".parquet", ".feather"):
+        read = pd.read_parquet if ext == ".parquet" else pd.read_feather
+        try:
+            key_df = read(key_path, columns=[JOIN_FIELD, KEY_FIELD])
+        except ImportError:
+            print(f"Error: reading a {ext} key requires pyarrow (pip install pyarrow).")
+            sys.exit(1)
+        except ValueError:
+            print(f"Key file must contain '{JOIN_FIELD}' and '{KEY_FIELD}' columns.")
+            sys.exit(1)
+        # ids may be stored as integers and Grouper_ID as a dictionary column
+        return key_df.astype(object).where(key_df.notna(), "").astype(str)
+    return pd.read_csv(
+        key_path,
+        sep=sep_for_path(key_path) or ',',
+        dtype=str,
+        keep_default_na=False,
+        encoding="utf-8-sig",
+        usecols=lambda c: c.strip() in (JOIN_FIELD, KEY_FIELD)
+    )
+
+def load_key_map(key_path):
+    """
+    Build the bels_location_id → Grouper_ID lookup from the key file.
+    Blank ids or blank Grouper_IDs are ignored; later rows win, like the sheet version.
+    """
+    key_df = read_key_table(key_path)
+    key_df.columns = [c.strip() for c in key_df.columns]
+    if JOIN_FIELD not in key_df.columns or KEY_FIELD not in key_df.columns:
+        print(f"Key file must contain '{JOIN_FIELD}' and '{KEY_FIELD}' columns.")
+        sys.exit(1)
+
+    ids = key_df[JOIN_FIELD].str.strip()
+    gids = key_df[KEY_FIELD].str.strip()
+    keep = (ids != "") & (gids != "")
+    return dict(zip(ids[keep], gids[keep]))
+
+def fill_grouper_ids(original_path, key_path, output_path=None, chunksize=CHUNKSIZE):
+    """
+    Streaming hash join of the key onto the original file.
+    The key lookup is held in memory; the original is read and written chunk by chunk,
+    so its row count is not limited by memory. Unmatched rows get a blank Grouper_ID.
+    """
+    for path in (original_path, key_path):
+        if not os.path.isfile(path):
+            print(f"Error: file not found: {path}")
+            sys.exit(1)
+
+    sep = sep_for_path(original_path)
+    if sep is None:
+        print("Unsupported file type. Please provide a .csv or .tsv file.")
+        sys.exit(1)
+
+    lookup = load_key_map(key_path)
+    print(f"Loaded {len(lookup):,} Grouper_IDs from {os.path.basename(key_path)}")
+
+    if output_path is None:
+        base, ext = os.path.splitext(original_path)
+        output_path = f"{base}-merged{ext}"
+
+    reader = pd.read_csv(
+        original_path,
+        sep=sep,
+        dtype=str,
+        keep_default_na=False,
+        encoding="utf-8-sig",
+        chunksize=chunksize
+    )
+
+    total_rows = 0
+    matched_rows = 0
+    target_col = None
+
+    for i, chunk in enumerate(reader):
+        if i == 0:
+            if JOIN_FIELD not in chunk.columns:
+                print(f"Original file must contain a '{JOIN_FIELD}' column.")
+                sys.exit(1)
+            # Same target as the sheet tool: "Grouper_ID", falling back to "FinalName"
+            if KEY_FIELD in chunk.columns:
+                target_col = KEY_FIELD
+            elif "FinalName" in chunk.columns:
+                target_col = "FinalName"
+            else:
+                target_col = KEY_FIELD
+                print(f"Note: no '{KEY_FIELD}' or 'FinalName' column found; appending '{KEY_FIELD}'.")
+
+        mapped = chunk[JOIN_FIELD].str.strip().map(lookup)
+        matched_rows += int(mapped.notna().sum())
+        total_rows += len(chunk)
+        chunk[target_col] = mapped.fillna("")
+
+        chunk.to_csv(
+            output_path,
+            sep=sep,
+            index=False,
+            header=(i == 0),
+            mode="w" if i == 0 else "a",
+            encoding="utf-8"
+        )
+
+    if target_col is None:
+        print("Error: original file is empty.")
+        sys.exit(1)
+
+    print(f"\nRows written: {total_rows:,}")
+    print(f"  with a Grouper_ID from the key: {matched_rows:,}")
+    print(f"  without a match (left blank):   {total_rows - matched_rows:,}")
+    print(f"Saved: {output_path}")
+    return output_path
+
+def main():
+    args = parse_args()
+    original_path = pick_path(args.original_path, "Enter path to the original CSV/TSV file: ")
+    key_path = pick_path(args.key_path, "Enter path to the -key file: ")
+    if not original_path or not key_path:
+        print("No file provided.")
+        sys.exit(0)
+    fill_grouper_ids(original_path, key_path, args.output, args.chunksize)
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,14 @@ import os
 import sys
 import csv
 import re
+import io
+import gzip
+import bz2
+import lzma
+import zipfile
+import mmap
+import json
+from array import array
 import argparse
 from collections import defaultdict
 
@@ -10,8 +18,22 @@ CHUNKSIZE = 100_000          # rows between flushes
 INPUT_ENCODING = "utf-8"     # adjust if needed
 INPUT_ERRORS = "replace"     # tolerate odd characters
 OUTPUT_NEWLINE = ""          # good CSV behavior on Windows
+INDEX_SUFFIX = ".idx"        # sidecar index written by --index
+COPY_BLOCK = 16 << 20        # bytes copied per write when extracting
+ARROW_BLOCK_SIZE = 16 << 20  # bytes per record batch with --engine pyarrow
 # ----------------------------
 
+# Compressed input is detected from magic bytes first, then the extension
+MAGIC_BYTES = (
+    (b"\x1f\x8b", "gz"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zst"),
+    (b"PK\x03\x04", "zip"),
+)
+COMPRESSED_EXTENSIONS = {".gz": "gz", ".bz2": "bz2", ".xz": "xz", ".zst": "zst", ".zstd": "zst", ".zip": "zip"}
+STREAM_OPENERS = {"gz": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+
 def parse_args():
     p = argparse.ArgumentParser(
         description="Split a CSV into files by (institutionCode, collectionCode) with optional filters."
@@ -21,6 +43,30 @@ def parse_args():
         nargs="?",
         help="Path to input CSV file"
     )
+    p.add_argument(
+        "--compress",
+        choices=["gz", "bz2", "xz", "zst"],
+        help="Write each output file compressed (<name>.csv.gz etc.; zst needs the zstandard package)"
+    )
+    p.add_argument(
+        "--engine",
+        choices=["csv", "pyarrow"],
+        default="csv",
+        help="csv: Python csv module (default); pyarrow: vectorized filters over record batches (needs pyarrow)"
+    )
+    p.add_argument(
+        "--index",
+        action="store_true",
+        help=("Don't split; record the byte ranges of every (institution, collection)'s rows "
+              "in a <input>.idx sidecar file (uncompressed input only)")
+    )
+    p.add_argument(
+        "--extract",
+        action="append",
+        metavar="INST[:COLL]",
+        help=("Write only this institution (all its collections) or institution:collection, "
+              "copied straight from the input via the index (built first if missing). Repeatable.")
+    )
     p.add_argument(
         "--review-only",
         help=("Comma-separated allowed values for the 'review' column (case-insensitive). "
@@ -44,6 +90,95 @@ def parse_review_whitelist(arg_val: str):
     parts = [normalize_token(x) for x in arg_val.split(",")]
     return {x for x in parts if x != ""} or None
 
+def require_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        print("Error: .zst files need the zstandard package (pip install zstandard).")
+        sys.exit(1)
+    return zstandard
+
+def detect_compression(path):
+    """'gz', 'bz2', 'xz', 'zst', 'zip' or None (plain text), by magic bytes, then by extension."""
+    with open(path, "rb") as f:
+        magic = f.read(6)
+    for prefix, kind in MAGIC_BYTES:
+        if magic.startswith(prefix):
+            return kind
+    return COMPRESSED_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+def open_binary_input(path):
+    """
+    Binary stream over the input, decompressing on the fly (the data never touches disk uncompressed).
+    A .zip must hold a single file, or its first .csv member is used.
+    """
+    kind = detect_compression(path)
+    if kind is None:
+        return open(path, "rb")
+    if kind in STREAM_OPENERS:
+        return STREAM_OPENERS[kind](path, "rb")
+    if kind == "zst":
+        # read_across_frames: appended outputs (see open_output) hold one frame per flush
+        return require_zstandard().ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True)
+    with zipfile.ZipFile(path) as zf:
+        members = [m for m in zf.infolist() if not m.is_dir()]
+        csv_members = [m for m in members if m.filename.lower().endswith(".csv")]
+        if len(members) != 1 and not csv_members:
+            print(f"Error: no .csv file inside {os.path.basename(path)}")
+            sys.exit(1)
+        return zf.open(members[0] if len(members) == 1 else csv_members[0])
+
+def open_input(path):
+    """Text stream over the (possibly compressed) input."""
+    if detect_compression(path) is None:
+        return open(path, "r", encoding=INPUT_ENCODING, errors=INPUT_ERRORS, newline="")
+    return io.TextIOWrapper(open_binary_input(path), encoding=INPUT_ENCODING, errors=INPUT_ERRORS, newline="")
+
+class Utf8Reader(io.RawIOBase):
+    """
+    Binary stream of valid UTF-8 over the (possibly compressed) input: bytes are decoded as open_input
+    does (INPUT_ENCODING, invalid sequences replaced) and encoded again, so pyarrow never sees invalid bytes.
+    """
+    def __init__(self, path, chars=ARROW_BLOCK_SIZE // 4):
+        self._text = open_input(path)
+        self._chars = chars
+        self._pending = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._pending:
+            self._pending = memoryview(self._text.read(self._chars).encode("utf-8"))
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        self._text.close()
+        super().close()
+
+def open_output(path, compress=None):
+    """
+    Append-mode text stream for one output file. Compressed outputs get one compressed
+    member/frame per flush; gzip, bzip2, xz and zstd readers all read such files as one stream.
+    """
+    if compress is None:
+        return open(path, "a", encoding="utf-8", newline=OUTPUT_NEWLINE)
+    if compress == "zst":
+        raw = require_zstandard().ZstdCompressor().stream_writer(open(path, "ab"))
+        return io.TextIOWrapper(raw, encoding="utf-8", newline=OUTPUT_NEWLINE)
+    return STREAM_OPENERS[compress](path, "at", encoding="utf-8", newline=OUTPUT_NEWLINE)
+
+def input_base_name(path):
+    """File name without its compression and data extensions: 'export.csv.gz' → 'export'."""
+    name = os.path.basename(path)
+    stem, ext = os.path.splitext(name)
+    if ext.lower() in COMPRESSED_EXTENSIONS:
+        name = stem
+    return os.path.splitext(name)[0]
+
 def safe_part(s: str) -> str:
     """
     Make a string safe for filenames:
@@ -56,24 +191,21 @@ def safe_part(s: str) -> str:
     s = re.sub(r"[^a-z0-9._-]", "-", s)
     return s if s else "blank"
 
-def split_csv_by_combo(in_path: str, review_only_set=None):
-    if not os.path.isfile(in_path):
-        print(f"Error: file not found: {in_path}")
-        sys.exit(1)
-
-    base_dir = os.path.dirname(in_path)
-    base_name = os.path.splitext(os.path.basename(in_path))[0]
-
-    # Peek header
-    with open(in_path, "r", encoding=INPUT_ENCODING, errors=INPUT_ERRORS, newline="") as f:
+def load_header(in_path):
+    """Peek the header row; exits when the file is empty."""
+    with open_input(in_path) as f:
         reader = csv.reader(f)
         try:
-            header = next(reader)
+            return next(reader)
         except StopIteration:
             print("Error: file is empty.")
             sys.exit(1)
 
-    # Case-insensitive header lookup
+def locate_columns(header, review_only_set=None):
+    """
+    Case-insensitive lookup of the key columns (exits when missing) and the optional filter columns.
+    Returns (cols, review_only_set); the review filter is dropped with a warning when there is no 'review' column.
+    """
     header_lut = {h.strip().lower(): i for i, h in enumerate(header)}
     if "institutioncode" not in header_lut:
         print('Error: Required column "institutionCode" not found.')
@@ -82,96 +214,113 @@ def split_csv_by_combo(in_path: str, review_only_set=None):
         print('Error: Required column "collectionCode" not found.')
         sys.exit(1)
 
-    inst_idx = header_lut["institutioncode"]
-    coll_idx = header_lut["collectioncode"]
-
-    # Optional filter columns
-    id_score_idx = header_lut.get("id_score")
-    instcount_idx = header_lut.get("institutioncount")
-    review_idx = header_lut.get("review")
+    cols = {
+        "inst": header_lut["institutioncode"],
+        "coll": header_lut["collectioncode"],
+        # Optional filter columns
+        "id_score": header_lut.get("id_score"),
+        "instcount": header_lut.get("institutioncount"),
+        "review": header_lut.get("review"),
+    }
 
     # Warn if user asked for review-only but column is missing
-    if review_only_set is not None and review_idx is None:
+    if review_only_set is not None and cols["review"] is None:
         print("Warning: --review-only was provided, but 'review' column was not found. Review filter will be ignored.")
         review_only_set = None
 
     if review_only_set:
         print("Active review filter (allowed values):", ", ".join(sorted(review_only_set)))
+    return cols, review_only_set
+
+def exclusion_reason(row, width, cols, review_only_set):
+    """
+    Why a row is skipped ('malformed', 'id_score', 'instcount', 'review'), or None to keep it.
+    Rows with every field empty count as malformed: pyarrow reads a blank line as such a row.
+    """
+    if len(row) != width or not any(row):
+        return "malformed"
+    if cols["id_score"] is not None and row[cols["id_score"]].strip() == "0":
+        return "id_score"
+    if cols["instcount"] is not None and row[cols["instcount"]].strip() == "0":
+        return "instcount"
+    if review_only_set is not None and normalize_token(row[cols["review"]]) not in review_only_set:
+        return "review"
+    return None
+
+def print_precheck(total_rows, reasons, cols, review_only_set):
+    """reasons: {exclusion reason: row count}"""
+    malformed_rows = reasons.get("malformed", 0)
+    print(f"\nPrecheck:")
+    print(f"  Total data rows (excluding header): {total_rows:,}")
+    if malformed_rows:
+        print(f"  Malformed/skipped rows (column count mismatch or blank): {malformed_rows:,}")
+    print(f"  Will be excluded overall: {sum(reasons.values()) - malformed_rows:,}")
+    if cols["id_score"] is not None:
+        print(f"    - by id_score == 0: {reasons.get('id_score', 0):,}")
+    if cols["instcount"] is not None:
+        print(f"    - by institutioncount == 0: {reasons.get('instcount', 0):,}")
+    if review_only_set is not None:
+        print(f"    - by review not in allowed set: {reasons.get('review', 0):,}")
+    print()
+
+def output_path_for(base_dir, base_name, inst_val, coll_val, compress=None):
+    """
+    Filename pattern:
+      - If collectionCode is blank -> <inputbase>_<institution>.csv
+      - Else                       -> <inputbase>_<institution>-<collection>.csv
+    (plus .gz/.bz2/.xz/.zst with --compress)
+    """
+    safe_inst = safe_part(inst_val)
+    coll_blank = coll_val is None or str(coll_val).strip() == ""
+    if coll_blank:
+        fname = f"{base_name}_{safe_inst}.csv"
+    else:
+        safe_coll = safe_part(coll_val)
+        fname = f"{base_name}_{safe_inst}-{safe_coll}.csv"
+    if compress:
+        fname += f".{compress}"
+    return os.path.join(base_dir, fname)
+
+def split_csv_by_combo(in_path: str, review_only_set=None, compress=None):
+    if not os.path.isfile(in_path):
+        print(f"Error: file not found: {in_path}")
+        sys.exit(1)
+
+    base_dir = os.path.dirname(in_path)
+    base_name = input_base_name(in_path)
+    if compress == "zst":
+        require_zstandard()
+
+    header = load_header(in_path)
+    cols, review_only_set = locate_columns(header, review_only_set)
+    inst_idx = cols["inst"]
+    coll_idx = cols["coll"]
 
     ### PRECHECK: Count how many rows will be excluded
-    excluded_rows = 0
-    excluded_by_review = 0
-    excluded_by_idscore = 0
-    excluded_by_instcount = 0
-    malformed_rows = 0
     total_rows = 0
+    reasons = defaultdict(int)
 
-    with open(in_path, "r", encoding=INPUT_ENCODING, errors=INPUT_ERRORS, newline="") as f:
+    with open_input(in_path) as f:
         reader = csv.reader(f)
         _ = next(reader, None)  # skip header
         for row in reader:
             total_rows += 1
-            if len(row) != len(header):
-                malformed_rows += 1
-                continue
-
-            # Filters
-            if id_score_idx is not None and row[id_score_idx].strip() == "0":
-                excluded_rows += 1
-                excluded_by_idscore += 1
-                continue
+            reason = exclusion_reason(row, len(header), cols, review_only_set)
+            if reason is not None:
+                reasons[reason] += 1
 
-            if instcount_idx is not None and row[instcount_idx].strip() == "0":
-                excluded_rows += 1
-                excluded_by_instcount += 1
-                continue
-
-            if review_only_set is not None:
-                rv = normalize_token(row[review_idx])
-                if rv not in review_only_set:
-                    excluded_rows += 1
-                    excluded_by_review += 1
-                    continue
-
-    print(f"\nPrecheck:")
-    print(f"  Total data rows (excluding header): {total_rows:,}")
-    if malformed_rows:
-        print(f"  Malformed/skipped rows (column count mismatch): {malformed_rows:,}")
-    print(f"  Will be excluded overall: {excluded_rows:,}")
-    if id_score_idx is not None:
-        print(f"    - by id_score == 0: {excluded_by_idscore:,}")
-    if instcount_idx is not None:
-        print(f"    - by institutioncount == 0: {excluded_by_instcount:,}")
-    if review_only_set is not None:
-        print(f"    - by review not in allowed set: {excluded_by_review:,}")
-    print()
+    print_precheck(total_rows, reasons, cols, review_only_set)
 
     header_written = set()
     counts = defaultdict(int)
     out_paths_by_key = {}
 
-    def out_path_for(inst_val, coll_val):
-        """
-        Filename pattern:
-          - If collectionCode is blank -> <inputbase>_<institution>.csv
-          - Else                       -> <inputbase>_<institution>-<collection>.csv
-        """
-        safe_inst = safe_part(inst_val)
-        coll_blank = coll_val is None or str(coll_val).strip() == ""
-        if coll_blank:
-            fname = f"{base_name}_{safe_inst}.csv"
-        else:
-            safe_coll = safe_part(coll_val)
-            fname = f"{base_name}_{safe_inst}-{safe_coll}.csv"
-        return os.path.join(base_dir, fname)
-
     def flush_grouped(grouped):
         """Write grouped rows to their respective files and clear the dict."""
-        nonlocal header_written
         for key, rows in grouped.items():
-            out_path = out_paths_by_key.setdefault(key, out_path_for(*key))
+            out_path = out_paths_by_key.setdefault(key, output_path_for(base_dir, base_name, *key, compress))
             write_header = out_path not in header_written
-            with open(out_path, "a", encoding="utf-8", newline=OUTPUT_NEWLINE) as out_f:
+            with open_output(out_path, compress) as out_f:
                 w = csv.writer(out_f)
                 if write_header:
                     w.writerow(header)
@@ -181,25 +330,16 @@ def split_csv_by_combo(in_path: str, review_only_set=None):
         grouped.clear()
 
     # Stream through the file and group rows
-    with open(in_path, "r", encoding=INPUT_ENCODING, errors=INPUT_ERRORS, newline="") as f:
+    with open_input(in_path) as f:
         reader = csv.reader(f)
         _ = next(reader, None)  # skip header
 
         grouped = defaultdict(list)
         for i, row in enumerate(reader, start=1):
-            if len(row) != len(header):
+            # Skip malformed and unwanted rows
+            if exclusion_reason(row, len(header), cols, review_only_set) is not None:
                 continue
 
-            # Skip unwanted rows
-            if id_score_idx is not None and row[id_score_idx].strip() == "0":
-                continue
-            if instcount_idx is not None and row[instcount_idx].strip() == "0":
-                continue
-            if review_only_set is not None:
-                rv = normalize_token(row[review_idx])
-                if rv not in review_only_set:
-                    continue
-
             inst_val = row[inst_idx]
             coll_val = row[coll_idx]
             key = (inst_val, coll_val)
@@ -211,12 +351,319 @@ def split_csv_by_combo(in_path: str, review_only_set=None):
         if grouped:
             flush_grouped(grouped)
 
-    # Summary
+    print_summary(counts, out_paths_by_key)
+
+def print_summary(counts, out_paths_by_key):
     print("\nDone. Created files:")
     for (inst, coll) in sorted(counts.keys(), key=lambda x: (str(x[0]).lower(), str(x[1] or "").lower())):
         outp = out_paths_by_key[(inst, coll)]
         print(f"  {os.path.basename(outp)}  —  {counts[(inst, coll)]:,} rows")
 
+def split_csv_by_combo_arrow(in_path: str, review_only_set=None, compress=None):
+    """
+    --engine pyarrow: the same split in one pass over pyarrow CSV record batches. The filters are
+    vectorized compute expressions and each batch is partitioned by the dictionary codes of
+    (institutionCode, collectionCode); the slices are written by csv.writer, so the files match the
+    csv engine's (minimal quoting, same header). Every column is read as a string. Rows with the wrong
+    column count are counted as malformed by the reader's invalid-row handler; blank lines are read as
+    rows of empty values, which the first filter counts as malformed (see exclusion_reason).
+    The input is read through Utf8Reader, so invalid bytes become U+FFFD as with the csv engine.
+    The precheck counts come from the same pass and are printed after it.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+        import pyarrow.compute as pc
+    except ImportError:
+        print("Error: --engine pyarrow requires pyarrow (pip install pyarrow).")
+        sys.exit(1)
+
+    if not os.path.isfile(in_path):
+        print(f"Error: file not found: {in_path}")
+        sys.exit(1)
+
+    base_dir = os.path.dirname(in_path)
+    base_name = input_base_name(in_path)
+    if compress == "zst":
+        require_zstandard()
+
+    header = load_header(in_path)
+    cols, review_only_set = locate_columns(header, review_only_set)
+    # positional names: real headers can repeat or be blank
+    names = [f"c{i}" for i in range(len(header))]
+
+    reasons = defaultdict(int)
+    unparsed_rows = 0
+
+    def skip_invalid(row):
+        nonlocal unparsed_rows
+        unparsed_rows += 1
+        reasons["malformed"] += 1
+        return "skip"
+
+    def trimmed(batch, idx):
+        return pc.utf8_trim_whitespace(batch.column(idx))
+
+    def blank(batch):
+        empty = None
+        for column in batch.columns:
+            is_empty = pc.equal(pc.binary_length(column), 0)
+            empty = is_empty if empty is None else pc.and_(empty, is_empty)
+        return empty
+
+    # (reason, batch → rows failing that filter), checked in the same order as exclusion_reason
+    checks = [("malformed", blank)]
+    if cols["id_score"] is not None:
+        checks.append(("id_score", lambda batch: pc.equal(trimmed(batch, cols["id_score"]), "0")))
+    if cols["instcount"] is not None:
+        checks.append(("instcount", lambda batch: pc.equal(trimmed(batch, cols["instcount"]), "0")))
+    if review_only_set is not None:
+        allowed = pa.array(sorted(review_only_set), pa.string())
+        checks.append(("review", lambda batch: pc.invert(
+            pc.is_in(pc.utf8_lower(trimmed(batch, cols["review"])), value_set=allowed))))
+
+    header_written = set()
+    counts = defaultdict(int)
+    out_paths_by_key = {}
+    total_rows = 0
+
+    with io.BufferedReader(Utf8Reader(in_path), ARROW_BLOCK_SIZE) as raw:
+        reader = pacsv.open_csv(
+            raw,
+            read_options=pacsv.ReadOptions(column_names=names, skip_rows=1, block_size=ARROW_BLOCK_SIZE),
+            parse_options=pacsv.ParseOptions(newlines_in_values=True, ignore_empty_lines=False,
+                                             invalid_row_handler=skip_invalid),
+            convert_options=pacsv.ConvertOptions(column_types={n: pa.string() for n in names},
+                                                 strings_can_be_null=False, quoted_strings_can_be_null=False),
+        )
+        for batch in reader:
+            total_rows += batch.num_rows
+
+            keep = None
+            for reason, failing in checks:
+                bad = failing(batch)
+                newly = bad if keep is None else pc.and_(keep, bad)
+                reasons[reason] += pc.sum(newly.cast(pa.int64())).as_py() or 0
+                keep = pc.invert(bad) if keep is None else pc.and_(keep, pc.invert(bad))
+            batch = batch.filter(keep)
+            if batch.num_rows == 0:
+                continue
+
+            # partition by (institution, collection) dictionary codes; the sort is stable, so row order is kept
+            inst = pc.dictionary_encode(batch.column(cols["inst"]))
+            coll = pc.dictionary_encode(batch.column(cols["coll"]))
+            n_coll = len(coll.dictionary)
+            codes = pc.add(pc.multiply(inst.indices.cast(pa.int64()), n_coll), coll.indices.cast(pa.int64()))
+            order = pc.sort_indices(codes)
+            runs = pc.run_end_encode(codes.take(order))
+            rows = list(zip(*(column.to_pylist() for column in batch.take(order).columns)))
+
+            start = 0
+            for end, code in zip(runs.run_ends.to_pylist(), runs.values.to_pylist()):
+                key = (inst.dictionary[code // n_coll].as_py(), coll.dictionary[code % n_coll].as_py())
+                out_path = out_paths_by_key.setdefault(key, output_path_for(base_dir, base_name, *key, compress))
+                with open_output(out_path, compress) as out_f:
+                    w = csv.writer(out_f)
+                    if out_path not in header_written:
+                        w.writerow(header)
+                        header_written.add(out_path)
+                    w.writerows(rows[start:end])
+                counts[key] += end - start
+                start = end
+
+    print_precheck(total_rows + unparsed_rows, reasons, cols, review_only_set)
+    print_summary(counts, out_paths_by_key)
+
+def iter_records(f):
+    """
+    (byte offset, raw bytes, row) of every CSV record in a binary file, starting at its current position.
+    Records are found by the same csv.reader the split uses, fed one line at a time, so quoted newlines
+    stay inside their record and a stray quote inside an unquoted field is read literally; a blank line
+    is an empty record, as when splitting.
+    """
+    pos = f.tell()
+    consumed = []
+
+    def lines():
+        # the same line ends as a text stream opened with newline="": \n, \r\n and a lone \r
+        for line in f:
+            body = line[:-2] if line.endswith(b"\r\n") else line[:-1]
+            for piece in (line.splitlines(keepends=True) if b"\r" in body else (line,)):
+                consumed.append(piece)
+                yield piece.decode(INPUT_ENCODING, INPUT_ERRORS)
+
+    for row in csv.reader(lines()):
+        record = consumed[0] if len(consumed) == 1 else b"".join(consumed)
+        consumed.clear()
+        yield pos, record, row
+        pos += len(record)
+
+def index_path_for(in_path):
+    return in_path + INDEX_SUFFIX
+
+def build_index(in_path, review_only_set=None):
+    """
+    One pass over the input applying the split filters, recording for each (institution, collection)
+    the byte ranges of its rows (adjacent rows of one key merge into one range).
+    Sidecar layout: one JSON line (input size/mtime, filters, header length, counts, keys with their
+    row and range counts), then per key its range offsets (uint64) and lengths (uint64).
+    """
+    if detect_compression(in_path) is not None:
+        print("Error: --index/--extract need an uncompressed input (rows are read by byte offset).")
+        sys.exit(1)
+
+    header = load_header(in_path)
+    cols, review_only_set = locate_columns(header, review_only_set)
+    inst_idx = cols["inst"]
+    coll_idx = cols["coll"]
+
+    total_rows = 0
+    reasons = defaultdict(int)
+    ranges = {}   # key -> [offsets, lengths, rows]
+
+    with open(in_path, "rb") as f:
+        records = iter_records(f)
+        _, header_bytes, _ = next(records)
+        for pos, record, row in records:
+            total_rows += 1
+            reason = exclusion_reason(row, len(header), cols, review_only_set)
+            if reason is not None:
+                reasons[reason] += 1
+                continue
+
+            key = (row[inst_idx], row[coll_idx])
+            entry = ranges.get(key)
+            if entry is None:
+                entry = ranges[key] = [array("Q"), array("Q"), 0]
+            offsets, lengths = entry[0], entry[1]
+            if offsets and offsets[-1] + lengths[-1] == pos:
+                lengths[-1] += len(record)
+            else:
+                offsets.append(pos)
+                lengths.append(len(record))
+            entry[2] += 1
+
+    print_precheck(total_rows, reasons, cols, review_only_set)
+
+    keys = sorted(ranges, key=lambda x: (str(x[0]).lower(), str(x[1] or "").lower()))
+    stat = os.stat(in_path)
+    meta = {
+        "input_size": stat.st_size,
+        "input_mtime_ns": stat.st_mtime_ns,
+        "review_only": sorted(review_only_set) if review_only_set is not None else None,
+        "byteorder": sys.byteorder,
+        "header_length": len(header_bytes),
+        "total_rows": total_rows,
+        "excluded": dict(reasons),
+        "keys": [[inst, coll, ranges[(inst, coll)][2], len(ranges[(inst, coll)][0])] for inst, coll in keys],
+    }
+    index_path = index_path_for(in_path)
+    with open(index_path, "wb") as out_f:
+        out_f.write(json.dumps(meta).encode("utf-8") + b"\n")
+        for key in keys:
+            ranges[key][0].tofile(out_f)
+            ranges[key][1].tofile(out_f)
+
+    n_ranges = sum(len(ranges[key][0]) for key in keys)
+    print(f"Indexed {sum(ranges[key][2] for key in keys):,} rows of {len(keys):,} (institution, collection) keys "
+          f"as {n_ranges:,} byte ranges: {index_path} ({os.path.getsize(index_path):,} bytes)")
+    return index_path
+
+def load_index(in_path, review_only_set=None):
+    """
+    (meta, {key: (offsets, lengths)}) from the sidecar index, or None when it is missing,
+    out of date with the input, or built with a different review filter.
+    """
+    index_path = index_path_for(in_path)
+    if not os.path.isfile(index_path):
+        return None
+    with open(index_path, "rb") as f:
+        meta = json.loads(f.readline())
+        stat = os.stat(in_path)
+        if (meta["input_size"], meta["input_mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            print(f"Note: {os.path.basename(index_path)} is older than the input; rebuilding it.")
+            return None
+        wanted = sorted(review_only_set) if review_only_set is not None else None
+        if meta["review_only"] != wanted:
+            print(f"Note: {os.path.basename(index_path)} was built with a different review filter; rebuilding it.")
+            return None
+        ranges = {}
+        for inst, coll, _, n_ranges in meta["keys"]:
+            offsets, lengths = array("Q"), array("Q")
+            offsets.fromfile(f, n_ranges)
+            lengths.fromfile(f, n_ranges)
+            if meta["byteorder"] != sys.byteorder:
+                offsets.byteswap()
+                lengths.byteswap()
+            ranges[(inst, coll)] = (offsets, lengths)
+    return meta, ranges
+
+def parse_extract_key(spec):
+    """'TAES' → ('taes', None) for every collection; 'TAES:Herb' → ('taes', 'herb'); 'TAES:' → blank collection."""
+    inst, sep, coll = spec.partition(":")
+    return normalize_token(inst), (normalize_token(coll) if sep else None)
+
+def open_binary_output(path, compress=None, mode="wb"):
+    if compress is None:
+        return open(path, mode)
+    if compress == "zst":
+        return require_zstandard().ZstdCompressor().stream_writer(open(path, mode))
+    return STREAM_OPENERS[compress](path, mode)
+
+def extract_from_index(in_path, specs, review_only_set=None, compress=None):
+    """
+    Write the rows of the requested keys, byte for byte from the input, using the sidecar index
+    (built or rebuilt first when needed). Only the listed byte ranges are read (via mmap).
+    """
+    if not os.path.isfile(in_path):
+        print(f"Error: file not found: {in_path}")
+        sys.exit(1)
+    if compress == "zst":
+        require_zstandard()
+
+    loaded = load_index(in_path, review_only_set)
+    if loaded is None:
+        build_index(in_path, review_only_set)
+        loaded = load_index(in_path, review_only_set)
+    meta, ranges = loaded
+    counts = {tuple(key[:2]): key[2] for key in meta["keys"]}
+
+    wanted = [parse_extract_key(spec) for spec in specs]
+    keys = [key for key in ranges
+            if any(normalize_token(key[0]) == inst and (coll is None or normalize_token(key[1]) == coll)
+                   for inst, coll in wanted)]
+    if not keys:
+        print("No indexed rows match:", ", ".join(specs))
+        return {}
+
+    # keys whose names only differ in case/spacing share an output file, as when splitting
+    base_dir = os.path.dirname(in_path)
+    base_name = input_base_name(in_path)
+    keys_by_path = defaultdict(list)
+    for key in keys:
+        keys_by_path[output_path_for(base_dir, base_name, *key, compress)].append(key)
+
+    written = {}
+    with open(in_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header_bytes = mm[:meta["header_length"]]
+        newline = b"\r\n" if header_bytes.endswith(b"\r\n") else b"\n"
+        for out_path, path_keys in keys_by_path.items():
+            path_ranges = sorted((offset, length) for key in path_keys for offset, length in zip(*ranges[key]))
+            with open_binary_output(out_path, compress) as out_f:
+                out_f.write(header_bytes)
+                for offset, length in path_ranges:
+                    for start in range(offset, offset + length, COPY_BLOCK):
+                        out_f.write(mm[start:min(start + COPY_BLOCK, offset + length)])
+                    # only the file's last row can lack a line ending
+                    if mm[offset + length - 1:offset + length] not in (b"\n", b"\r"):
+                        out_f.write(newline)
+            written[out_path] = sum(counts[key] for key in path_keys)
+
+    print("\nDone. Extracted files:")
+    for out_path in sorted(written, key=str.lower):
+        print(f"  {os.path.basename(out_path)}  —  {written[out_path]:,} rows")
+    return written
+
 def main():
     args = parse_args()
     in_path = pick_csv_path(args)
@@ -224,7 +671,19 @@ def main():
         print("No file provided.")
         sys.exit(0)
     review_only_set = parse_review_whitelist(args.review_only)
-    split_csv_by_combo(in_path, review_only_set)
+    if args.index or args.extract:
+        if not os.path.isfile(in_path):
+            print(f"Error: file not found: {in_path}")
+            sys.exit(1)
+        if args.index:
+            build_index(in_path, review_only_set)
+        if args.extract:
+            extract_from_index(in_path, args.extract, review_only_set, args.compress)
+        return
+    if args.engine == "pyarrow":
+        split_csv_by_combo_arrow(in_path, review_only_set, args.compress)
+    else:
+        split_csv_by_combo(in_path, review_only_set, args.compress)
 
 if __name__ == "__main__":
     main()
@@ -1,70 +1,330 @@
 import pandas as pd
+import numpy as np
 import re
 import os
 import warnings
-from rapidfuzz import fuzz, process
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from collections import defaultdict
 import time
+import tempfile
+import atexit
+import hashlib
+import glob
+import json
+import zipfile
 import argparse
 import sys
 
 warnings.filterwarnings("ignore", message="The parameter 'token_pattern' will not be used since 'tokenizer' is not None'")
 
+GROUPING_FIELD = "bels_location_id"
+
+# every worker holds its own dense N × N similarity matrix, so the default stays small
+DEFAULT_BATCH_WORKERS = 2
 
-def load_input_csv(grouping_field):
-    """Loads in either CSV or TSV path and checks required columns"""
 
-    # initializing arg-parser
+def build_parser(grouping_field):
+    """Command line options for grouper_main (also the option names and defaults of the importable API)"""
     parser = argparse.ArgumentParser(description="Group and normalize locality strings.")
     parser.add_argument(
         "csv_path",
         nargs="?",   # <-- makes it optional
-        help="Path to input CSV or TSV file containing 'locality' and '{}' columns".format(grouping_field)
+        help=("Path to input CSV or TSV file containing 'locality' and '{}' columns, "
+              "or a folder or glob of them (e.g. \"splits/*.csv\") for batch mode").format(grouping_field)
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=["csv", "parquet", "feather"],
+        default="csv",
+        help="Format of the -key file (and of the merged file with --write-merged). parquet/feather need pyarrow."
+    )
+    parser.add_argument(
+        "--write-merged",
+        action="store_true",
+        help="Also write the full input with Grouper_ID and normalized_locality merged back (<name>-grouped.<ext>)"
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Vectorize and compare every record even when normalized localities are identical (slower; for comparison)"
+    )
+    parser.add_argument(
+        "--grouping",
+        choices=["greedy", "components"],
+        default="greedy",
+        help=("greedy: join the first earlier record's group when directly similar to it (order-dependent); "
+              "components: connected components of the similarity graph (order-independent)")
+    )
+    parser.add_argument(
+        "--max-diameter",
+        type=int,
+        help=("components mode only: cap groups at this many similarity hops across (≥ 2); groups are carved "
+              "around the records with the most neighbors first (ties by text), so they don't depend on row order")
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.85,
+        help="Cosine similarity needed to group two records (default 0.85)"
     )
+    parser.add_argument(
+        "--singleton-similarity",
+        type=float,
+        default=0.80,
+        help="Minimum similarity for placing a singleton after its closest group (default 0.80)"
+    )
+    parser.add_argument(
+        "--sweep",
+        type=parse_sweep,
+        metavar="START:STOP:STEP",
+        help="Report group/singleton counts and confidence for every threshold in the range "
+             "(e.g. 0.75:0.95:0.01) from one similarity graph, instead of exporting a key"
+    )
+    parser.add_argument(
+        "--similarity-dtype",
+        choices=["float64", "float32"],
+        default="float64",
+        help="Precision of the dense similarity matrix (greedy mode); float32 halves its memory"
+    )
+    parser.add_argument(
+        "--similarity-memmap",
+        metavar="SCRATCH_DIR",
+        help=("Build the dense similarity matrix (greedy mode) in row blocks in a memory-mapped file in this folder "
+              "(e.g. on NVMe) instead of RAM")
+    )
+    parser.add_argument(
+        "--features",
+        choices=["vocabulary", "hashing"],
+        default="vocabulary",
+        help=("vocabulary: TfidfVectorizer with an in-memory vocabulary; "
+              "hashing: HashingVectorizer with a fixed number of features (for huge multi-state vocabularies)")
+    )
+    parser.add_argument(
+        "--n-features",
+        type=int,
+        default=2 ** 20,
+        help="Number of hashed features in --features hashing mode (default 2**20)"
+    )
+    parser.add_argument(
+        "--feature-chunksize",
+        type=int,
+        default=50_000,
+        help="Localities tokenized/transformed per chunk in --features hashing mode (default 50,000)"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store_true",
+        help="Save stage checkpoints in <input>-checkpoints/ (the latest per stage) for a later --resume"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Pick up from the latest valid checkpoint for this input file and these settings (implies --checkpoint)"
+    )
+    parser.add_argument(
+        "--rescore",
+        nargs="?",
+        const=(0.70, 0.90),
+        type=parse_band,
+        metavar="LOW:HIGH",
+        help=("Rescore pairs with cosine in [LOW, HIGH) (default 0.70:0.90) with RapidFuzz token_set_ratio "
+              "and blend it into their similarity")
+    )
+    parser.add_argument(
+        "--rescore-weight",
+        type=float,
+        default=0.5,
+        help="Share of the blended score taken from token_set_ratio (default 0.5)"
+    )
+    parser.add_argument(
+        "--rescore-cutoff",
+        type=float,
+        default=50,
+        help="token_set_ratio scores (0–100) below this count as 0 (default 50)"
+    )
+    parser.add_argument(
+        "--alias-map",
+        metavar="ALIASES_CSV",
+        help="Start alias discovery from the aliases in this file (e.g. an earlier run's -aliases.csv, other/canonical columns)"
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Print every alias as it is found (they are always saved to <name>-aliases.csv)"
+    )
+    parser.add_argument(
+        "--profile-rules",
+        action="store_true",
+        help="Time every preprocessing rule and count the localities it changes; writes <name>-rules.csv"
+    )
+    parser.add_argument(
+        "--locality-index",
+        metavar="INDEX_DIR",
+        help="Folder of earlier finalized georeferences; adds the closest one per group to the key as Prior_* columns"
+    )
+    parser.add_argument(
+        "--update-index",
+        nargs=2,
+        metavar=("KEY_FILE", "FROM_COGE_CSV"),
+        help="Add a reviewed batch (its -key file and the From CoGe sheet as CSV) to --locality-index, then exit"
+    )
+    parser.add_argument(
+        "--prior-similarity",
+        type=float,
+        default=0.85,
+        help="Minimum cosine similarity for a Prior_* match from the locality index (default 0.85)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help=f"Batch mode: files grouped in parallel (default {DEFAULT_BATCH_WORKERS}; each worker needs the memory of a whole run)"
+    )
+    parser.add_argument(
+        "--shared-aliases",
+        action="store_true",
+        help="Batch mode: learn one alias map from all files' vocabularies and apply it to every file"
+    )
+    parser.add_argument(
+        "--serve",
+        nargs="?",
+        const=8765,
+        type=int,
+        metavar="PORT",
+        help="Run as a local job server on 127.0.0.1:PORT (default 8765) instead of processing one file"
+    )
+    parser.add_argument(
+        "--serve-token",
+        metavar="TOKEN",
+        help="Job server: token clients must send in an X-Grouper-Token header (default: a random one, printed at start)"
+    )
+    return parser
+
+
+def check_options(args):
+    """Checks argparse can't express on its own; raises ValueError."""
+    if not 0 <= args.rescore_weight <= 1:
+        raise ValueError("--rescore-weight must be between 0 and 1")
+    if args.max_diameter is not None and args.max_diameter < 2:
+        raise ValueError("--max-diameter must be at least 2")
+    if args.workers is not None and args.workers < 1:
+        raise ValueError("--workers must be at least 1")
+    if args.update_index and not args.locality_index:
+        raise ValueError("--update-index needs --locality-index INDEX_DIR")
+    if args.locality_index and not args.update_index and not os.path.isfile(
+            os.path.join(args.locality_index, 'vocabulary.json')):
+        raise ValueError(f"No locality index in {args.locality_index}; create it with --update-index")
+    if not 0 < args.prior_similarity <= 1:
+        raise ValueError("--prior-similarity must be in (0, 1]")
+    if args.alias_map:
+        if not os.path.isfile(args.alias_map):
+            raise ValueError(f"--alias-map file not found: {args.alias_map}")
+        load_alias_map(args.alias_map)
+
+
+def parse_args(grouping_field):
+    parser = build_parser(grouping_field)
     args = parser.parse_args()
+    try:
+        check_options(args)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def grouping_options(**options):
+    """
+    Options namespace for the importable API: the command line defaults updated with keyword
+    arguments named like the options (threshold=0.8, grouping='components', rescore=(0.7, 0.9), ...).
+    sweep and rescore also accept their command line strings ('0.75:0.95:0.01', '0.70:0.90').
+    Raises ValueError for unknown names or invalid values.
+    """
+    parser = build_parser(GROUPING_FIELD)
+    args = parser.parse_args([])
+    unknown = sorted(set(options) - set(vars(args)))
+    if unknown:
+        raise ValueError(f"Unknown option(s): {', '.join(unknown)}")
+
+    for name, parse in (('sweep', parse_sweep), ('rescore', parse_band)):
+        if isinstance(options.get(name), str):
+            try:
+                options[name] = parse(options[name])
+            except argparse.ArgumentTypeError as e:
+                raise ValueError(f"{name}: {e}")
+    if options.get('sweep') is not None:
+        options['sweep'] = np.asarray(options['sweep'], dtype=np.float64)
+
+    choices = {action.dest: action.choices for action in parser._actions if action.choices}
+    for name, value in options.items():
+        if name in choices and value not in choices[name]:
+            raise ValueError(f"{name} must be one of {', '.join(map(str, choices[name]))}, not {value!r}")
+
+    vars(args).update(options)
+    check_options(args)
+    return args
+
+
+def load_input_csv(grouping_field, csv_path=None):
+    """Loads in either CSV or TSV path and checks required columns"""
 
     # If not provided on command line, prompt the user
-    if args.csv_path:
-        csv_path = args.csv_path
-    else:
+    if not csv_path:
         csv_path = input("Enter path to CSV/TSV file: ").strip()
 
-    if not os.path.isfile(csv_path):
-        print(f"File not found: {csv_path}")
+    try:
+        df, sep = read_input_file(csv_path, grouping_field)
+    except (OSError, ValueError) as e:
+        print(e)
         sys.exit(1)
 
+    return df, sep, csv_path
+
+
+def read_input_file(csv_path, grouping_field):
+    """Reads a .csv/.tsv input and checks its columns; raises FileNotFoundError/ValueError instead of exiting"""
+    if not os.path.isfile(csv_path):
+        raise FileNotFoundError(f"File not found: {csv_path}")
+
     ext = os.path.splitext(csv_path)[1].lower()
     sep = '\t' if ext == '.tsv' else ',' if ext == '.csv' else None
 
     if sep is None:
-        print("Unsupported file type. Please provide a .csv or .tsv file.")
-        sys.exit(1)
+        raise ValueError("Unsupported file type. Please provide a .csv or .tsv file.")
 
     df = pd.read_csv(csv_path, sep=sep)
+    check_columns(df, grouping_field)
+    return df, sep
+
 
+def check_columns(df, grouping_field):
     if 'locality' not in df.columns or grouping_field not in df.columns:
-        print(f"CSV must contain 'locality' and '{grouping_field}' columns.")
-        sys.exit(1)
+        raise ValueError(f"CSV must contain 'locality' and '{grouping_field}' columns.")
+
 
-    return df, sep, csv_path
 
+def build_preprocess_rules():
+    """
+    The preprocess steps in order, as (name, family, function) with precompiled patterns, and the
+    trigger of each gated family: a cheap search that must match somewhere in the text for any rule
+    of the family to change it, so preprocess() can skip the whole family when it doesn't.
+    name is the pattern (or a short description), family groups related rules.
+    """
+    rules = []
+    family_patterns = {}
 
+    def sub(family, pattern, repl, flags=0):
+        compiled = re.compile(pattern, flags)
+        rules.append((pattern, family, lambda text: compiled.sub(repl, text)))
+        family_patterns.setdefault(family, []).append((pattern, flags))
 
-def preprocess(text):
-    """normalize, and apply regex modifications to locality text"""
-    if pd.isnull(text):
-        return ""
+    def step(family, name, function):
+        rules.append((name, family, function))
 
-    text = text.lower()
+    step('cleanup', 'lowercase', str.lower)
 
     # Replace all Unicode space-like characters with a normal space
-    text = re.sub(r'[\u00A0\u2000-\u200B\u202F\u205F\u3000]', ' ', text)
+    sub('cleanup', r'[\u00A0\u2000-\u200B\u202F\u205F\u3000]', ' ')
 
     # Remove pound/hash symbols
-    text = text.replace('#', '')
-    
+    step('cleanup', "remove '#'", lambda text: text.replace('#', ''))
+
     # Words and phrases to remove
     REMOVE_TERMS = [
         r'\bu\.?\s*s\.?\s*a\.?\b',  # USA, U.S.A., etc.
@@ -87,92 +347,86 @@ def preprocess(text):
     ]
 
     for pattern in REMOVE_TERMS:
-        text = re.sub(pattern, '', text, flags=re.IGNORECASE)
-
+        sub('remove_terms', pattern, '', re.IGNORECASE)
 
     # --- Remove repeated locality prefix before semicolon if repeated later "Oklahoma City; near county line on W 10th street, Oklahoma City"---
-    if ";" in text:
-        prefix, rest = text.split(";", 1)
-        prefix = prefix.strip()
-        if prefix and prefix in rest:
-            text = rest.strip()
+    step('cleanup', 'repeated prefix before ;', drop_repeated_prefix)
 
     # --- Normalize possessives ---
-    text = re.sub(r"\b(\w+)'s\b", r"\1s", text)
+    sub('cleanup', r"\b(\w+)'s\b", r"\1s")
 
     # Normalize all variants of "mi", "mi.", " mi " to " miles "
-    text = re.sub(r'\bmis\.?\b', ' miles ', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bmi\.?\b', ' miles ', text, flags=re.IGNORECASE)
+    sub('units', r'\bmis\.?\b', ' miles ', re.IGNORECASE)
+    sub('units', r'\bmi\.?\b', ' miles ', re.IGNORECASE)
 
     # --- Normalize "km" to " kilometers " and "'" to " feet "
-    text = re.sub(r'\bkm\.?\b', ' kilometers ', text, flags=re.IGNORECASE)
-    text = re.sub(r"(\d+)\s*['’]", r"\1 feet", text)
-
+    sub('units', r'\bkm\.?\b', ' kilometers ', re.IGNORECASE)
+    sub('units', r"(\d+)\s*['’]", r"\1 feet")
 
     # Handles glued and spaced versions like "100m" and "100 m"
-    text = re.sub(r'\b(\d+(?:\.\d+)?)\s*m\b', convert_m_unit, text, flags=re.IGNORECASE)
+    sub('units', r'\b(\d+(?:\.\d+)?)\s*m\b', convert_m_unit, re.IGNORECASE)
 
     # Insert a space between numbers and units if stuck together (e.g., "5miles" → "5 miles")
-    text = re.sub(r'(\d+(?:\.\d+)?)(?=\s*?(miles|mile|km|kilometers|kilometer|mi|ft|feet))', r'\1 ', text, flags=re.IGNORECASE)
+    sub('units', r'(\d+(?:\.\d+)?)(?=\s*?(miles|mile|km|kilometers|kilometer|mi|ft|feet))', r'\1 ', re.IGNORECASE)
 
     # --- Force singular "mile" to plural "miles" ---
-    text = re.sub(r'\bmile\b', 'miles', text, flags=re.IGNORECASE)
+    sub('units', r'\bmile\b', 'miles', re.IGNORECASE)
 
     # --- Normalize all forms of 'state highway' ---
-    text = re.sub(r'\bstate\s+highway\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bstate\s+hiway\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bstate\s+hwy\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bstate\s+hwy\.?\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bsh\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bst\.?\s*hwy\.?\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bus\s+hwy\.?\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bstate\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bhy\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
+    sub('highways', r'\bstate\s+highway\s+(\d+)\b', r'highway \1', re.IGNORECASE)
+    sub('highways', r'\bstate\s+hiway\s+(\d+)\b', r'highway \1', re.IGNORECASE)
+    sub('highways', r'\bstate\s+hwy\s+(\d+)\b', r'highway \1', re.IGNORECASE)
+    sub('highways', r'\bstate\s+hwy\.?\s+(\d+)\b', r'highway \1', re.IGNORECASE)
+    sub('highways', r'\bsh\s+(\d+)\b', r'highway \1', re.IGNORECASE)
+    sub('highways', r'\bst\.?\s*hwy\.?\s+(\d+)\b', r'highway \1', re.IGNORECASE)
+    sub('highways', r'\bus\s+hwy\.?\s+(\d+)\b', r'highway \1', re.IGNORECASE)
+    sub('highways', r'\bstate\s+(\d+)\b', r'highway \1', re.IGNORECASE)
+    sub('highways', r'\bhy\s+(\d+)\b', r'highway \1', re.IGNORECASE)
     # --- Fallback catch-all for unnumbered state highways ---
-    text = re.sub(r'\b(state\s+hwy|state\s+highway|sh|st\.?\s*hwy)\b', 'highway', text, flags=re.IGNORECASE)
+    sub('highways', r'\b(state\s+hwy|state\s+highway|sh|st\.?\s*hwy)\b', 'highway', re.IGNORECASE)
 
     # Normalize "TX 10", "Tex 10", "Texas 10" → "highway 10"
-    text = re.sub(r'\btex(?:as)?\.?\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
+    sub('highways', r'\btex(?:as)?\.?\s+(\d+)\b', r'highway \1', re.IGNORECASE)
     # Normalize "OK 10", "Okla 10", "Oklahoma 10" → "highway 10"
-    text = re.sub(r'\bok(?:la)?(?:homa)?\.?\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
+    sub('highways', r'\bok(?:la)?(?:homa)?\.?\s+(\d+)\b', r'highway \1', re.IGNORECASE)
 
     # --- Normalize specific U.S. Highway variants to "highway <number>" ---
-    text = re.sub(r'\bu\.?\s*s\.?\s+(highway|hwy)\s+(\d+)\b', r'highway \2', text, flags=re.IGNORECASE)  # handles "U. S. Hwy"
-    text = re.sub(r'\bus\s+highway\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bus\s+hwy\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bus\.?\s*hwy\.?\s*(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bush\s*(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
+    sub('highways', r'\bu\.?\s*s\.?\s+(highway|hwy)\s+(\d+)\b', r'highway \2', re.IGNORECASE)  # handles "U. S. Hwy"
+    sub('highways', r'\bus\s+highway\s+(\d+)\b', r'highway \1', re.IGNORECASE)
+    sub('highways', r'\bus\s+hwy\s+(\d+)\b', r'highway \1', re.IGNORECASE)
+    sub('highways', r'\bus\.?\s*hwy\.?\s*(\d+)\b', r'highway \1', re.IGNORECASE)
+    sub('highways', r'\bush\s*(\d+)\b', r'highway \1', re.IGNORECASE)
     # Normalize bare US highway numbers like "US 10", "U.S. 10", "U. S. 10"
-    text = re.sub(r'\bu\.?\s*s\.?\s*(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bus\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
+    sub('highways', r'\bu\.?\s*s\.?\s*(\d+)\b', r'highway \1', re.IGNORECASE)
+    sub('highways', r'\bus\s+(\d+)\b', r'highway \1', re.IGNORECASE)
     # Catch generic references to U.S. highways without numbers ---
-    text = re.sub(r'\b(u\.?\s*s\.?|us|ush)\s+(highway|hwy)\b', 'highway', text, flags=re.IGNORECASE)
+    sub('highways', r'\b(u\.?\s*s\.?|us|ush)\s+(highway|hwy)\b', 'highway', re.IGNORECASE)
     # Normalize Interstate variants like "I-40", "I 40", "I. 40", "Interstate 40" → "highway 40"
-    text = re.sub(r'\binterstate\s+(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bi[\.\-\s]?(\d+)\b', r'highway \1', text, flags=re.IGNORECASE)
+    sub('highways', r'\binterstate\s+(\d+)\b', r'highway \1', re.IGNORECASE)
+    sub('highways', r'\bi[\.\-\s]?(\d+)\b', r'highway \1', re.IGNORECASE)
     # Normalize FM to farm-to-market
-    text = re.sub(r'\bf[\.\s]*m[\.\s]*(road)?[\s\.]*#?(\d+)\b',r'farm-to-market \2', text, flags=re.IGNORECASE)
+    sub('highways', r'\bf[\.\s]*m[\.\s]*(road)?[\s\.]*#?(\d+)\b', r'farm-to-market \2', re.IGNORECASE)
 
     # --- Split glued compass direction + "of" (e.g., " nof," → " n of,") ---
-    text = re.sub(r'(?<=\s)([nswe]{1,3})of(?=[\s\.,:;!?])', r'\1 of', text, flags=re.IGNORECASE)
+    sub('compass', r'(?<=\s)([nswe]{1,3})of(?=[\s\.,:;!?])', r'\1 of', re.IGNORECASE)
 
     # --- Normalize compound compass directions ---
-    text = re.sub(r'(?<!\w)[nN][\.\s]?[eE](?!\w)', 'northeast', text)
-    text = re.sub(r'(?<!\w)[nN][\.\s]?[wW](?!\w)', 'northwest', text)
-    text = re.sub(r'(?<!\w)[sS][\.\s]?[eE](?!\w)', 'southeast', text)
-    text = re.sub(r'(?<!\w)[sS][\.\s]?[wW](?!\w)', 'southwest', text)
+    sub('compass', r'(?<!\w)[nN][\.\s]?[eE](?!\w)', 'northeast')
+    sub('compass', r'(?<!\w)[nN][\.\s]?[wW](?!\w)', 'northwest')
+    sub('compass', r'(?<!\w)[sS][\.\s]?[eE](?!\w)', 'southeast')
+    sub('compass', r'(?<!\w)[sS][\.\s]?[wW](?!\w)', 'southwest')
 
     # --- Normalize single-letter compass directions ---
-    text = re.sub(r'(?<![\w\'])\bn[\.\s]*(?=\W|$)', 'north ', text, flags=re.IGNORECASE)
-    text = re.sub(r'(?<![\w\'])\bs[\.\s]*(?=\W|$)', 'south ', text, flags=re.IGNORECASE)
-    text = re.sub(r'(?<![\w\'])\be[\.\s]*(?=\W|$)', 'east ', text, flags=re.IGNORECASE)
-    text = re.sub(r'(?<![\w\'])\bw[\.\s]*(?=\W|$)', 'west ', text, flags=re.IGNORECASE)
+    sub('compass', r'(?<![\w\'])\bn[\.\s]*(?=\W|$)', 'north ', re.IGNORECASE)
+    sub('compass', r'(?<![\w\'])\bs[\.\s]*(?=\W|$)', 'south ', re.IGNORECASE)
+    sub('compass', r'(?<![\w\'])\be[\.\s]*(?=\W|$)', 'east ', re.IGNORECASE)
+    sub('compass', r'(?<![\w\'])\bw[\.\s]*(?=\W|$)', 'west ', re.IGNORECASE)
 
     # Join separated compass directions with optional periods
-    text = re.sub(r'\bnorth[\.\s]+east\b', 'northeast', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bnorth[\.\s]+west\b', 'northwest', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bsouth[\.\s]+east\b', 'southeast', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bsouth[\.\s]+west\b', 'southwest', text, flags=re.IGNORECASE)
+    sub('compass', r'\bnorth[\.\s]+east\b', 'northeast', re.IGNORECASE)
+    sub('compass', r'\bnorth[\.\s]+west\b', 'northwest', re.IGNORECASE)
+    sub('compass', r'\bsouth[\.\s]+east\b', 'southeast', re.IGNORECASE)
+    sub('compass', r'\bsouth[\.\s]+west\b', 'southwest', re.IGNORECASE)
 
     # Normalize space-separated compound directions like "west southwest" → "west-southwest"
     compound_directions = {
@@ -185,9 +439,9 @@ def preprocess(text):
         r'\bwest\s+northwest\b': 'west-northwest',
         r'\bwest\s+southwest\b': 'west-southwest',
     }
-    
+
     for pattern, replacement in compound_directions.items():
-        text = re.sub(pattern, replacement, text)
+        sub('compass', pattern, replacement)
 
     # Normalize compass abbreviations (e.g., NNE → north-northeast)
     abbr_map = {
@@ -202,10 +456,10 @@ def preprocess(text):
     }
 
     for abbr, full in abbr_map.items():
-        text = re.sub(rf'\b{abbr}\b', full, text, flags=re.IGNORECASE)
+        sub('compass', rf'\b{abbr}\b', full, re.IGNORECASE)
 
     # --- Common abbreviation replacements ---
-    
+
     ABBREVIATIONS = {
         r'\bjct\b': 'junction',
         r'\bint\b': 'intersection',
@@ -245,10 +499,10 @@ def preprocess(text):
         r'\bco\.\b': 'county',
         r'\bco\b': 'county'
     }
-    
+
     # Apply all abbreviation replacements
     for pattern, replacement in ABBREVIATIONS.items():
-        text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
+        sub('abbreviations', pattern, replacement, re.IGNORECASE)
 
     # --- Convert spelled-out ordinals like "tenth" to "10th" ---
     ordinal_words = {
@@ -261,7 +515,7 @@ def preprocess(text):
     }
 
     for word, ordinal in ordinal_words.items():
-        text = re.sub(rf'\b{word}\b', ordinal, text, flags=re.IGNORECASE)
+        sub('ordinals', rf'\b{word}\b', ordinal, re.IGNORECASE)
 
     # --- Convert spelled-out numbers before miles to digits ---
     number_words = {
@@ -273,27 +527,11 @@ def preprocess(text):
     }
 
     # --- Replace spelled-out numbers with digits only when followed by distance units or directional words using a lookahead pattern ---
-    directions = [
-            'north', 'south', 'east', 'west',
-            'northeast', 'northwest', 'southeast', 'southwest',
-            'north-northeast', 'north-northwest',
-            'south-southeast', 'south-southwest',
-            'east-northeast', 'east-southeast',
-            'west-northwest', 'west-southwest'
-    ]
-
-
     units_pattern = r'miles?|kilometers?|km|mi'
     directions_pattern = r'north|south|east|west|northeast|northwest|southeast|southwest'
-    
-    for word, digit in number_words.items():
-        text = re.sub(
-            rf'\b{word}\b(?=\s*({units_pattern}|{directions_pattern})\b)',
-            digit,
-            text,
-            flags=re.IGNORECASE
-        )
 
+    for word, digit in number_words.items():
+        sub('number_words', rf'\b{word}\b(?=\s*({units_pattern}|{directions_pattern})\b)', digit, re.IGNORECASE)
 
     # --- Normalize spelled-out fractions like "one-half" ---
     fraction_words = {
@@ -307,96 +545,221 @@ def preprocess(text):
     }
 
     for pattern, replacement in fraction_words.items():
-        text = re.sub(pattern, replacement, text)
-    
-    # --- Mixed ASCII fractions ---
-    text = re.sub(r'(\d+)\s+1/2\b', lambda m: str(float(m.group(1)) + 0.5), text)
-    text = re.sub(r'(\d+)\s+1/4\b', lambda m: str(float(m.group(1)) + 0.25), text)
-    text = re.sub(r'(\d+)\s+3/4\b', lambda m: str(float(m.group(1)) + 0.75), text)
-    text = re.sub(r'(\d+)\s+1/3\b', lambda m: str(float(m.group(1)) + 0.33), text)
-    text = re.sub(r'(\d+)\s+2/3\b', lambda m: str(float(m.group(1)) + 0.66), text)
-    text = re.sub(r'(\d+)\s+1/8\b', lambda m: str(float(m.group(1)) + 0.125), text)
+        sub('fraction_words', pattern, replacement)
 
+    # --- Mixed ASCII fractions ---
+    sub('fractions', r'(\d+)\s+1/2\b', lambda m: str(float(m.group(1)) + 0.5))
+    sub('fractions', r'(\d+)\s+1/4\b', lambda m: str(float(m.group(1)) + 0.25))
+    sub('fractions', r'(\d+)\s+3/4\b', lambda m: str(float(m.group(1)) + 0.75))
+    sub('fractions', r'(\d+)\s+1/3\b', lambda m: str(float(m.group(1)) + 0.33))
+    sub('fractions', r'(\d+)\s+2/3\b', lambda m: str(float(m.group(1)) + 0.66))
+    sub('fractions', r'(\d+)\s+1/8\b', lambda m: str(float(m.group(1)) + 0.125))
 
     # --- Mixed Unicode fractions ---
-    text = re.sub(r'(\d+)\s*½', lambda m: str(float(m.group(1)) + 0.5), text)
-    text = re.sub(r'(\d+)\s*¼', lambda m: str(float(m.group(1)) + 0.25), text)
-    text = re.sub(r'(\d+)\s*¾', lambda m: str(float(m.group(1)) + 0.75), text)
-    text = re.sub(r'(\d+)\s*⅓', lambda m: str(float(m.group(1)) + 0.33), text)
-    text = re.sub(r'(\d+)\s*⅔', lambda m: str(float(m.group(1)) + 0.66), text)
-    text = re.sub(r'(\d+)\s*⅛', lambda m: str(float(m.group(1)) + 0.125), text)
+    sub('fractions', r'(\d+)\s*½', lambda m: str(float(m.group(1)) + 0.5))
+    sub('fractions', r'(\d+)\s*¼', lambda m: str(float(m.group(1)) + 0.25))
+    sub('fractions', r'(\d+)\s*¾', lambda m: str(float(m.group(1)) + 0.75))
+    sub('fractions', r'(\d+)\s*⅓', lambda m: str(float(m.group(1)) + 0.33))
+    sub('fractions', r'(\d+)\s*⅔', lambda m: str(float(m.group(1)) + 0.66))
+    sub('fractions', r'(\d+)\s*⅛', lambda m: str(float(m.group(1)) + 0.125))
 
     # --- Standalone fractions ---
-    text = re.sub(r'\b1/2\b', '0.5', text)
-    text = re.sub(r'\b1/4\b', '0.25', text)
-    text = re.sub(r'\b3/4\b', '0.75', text)
-    text = re.sub(r'\b1/3\b', '0.33', text)
-    text = re.sub(r'\b2/3\b', '0.66', text)
-    text = re.sub(r'\b1/8\b', '0.125', text)
-    text = re.sub(r'\b½\b', '0.5', text)
-    text = re.sub(r'\b¼\b', '0.25', text)
-    text = re.sub(r'\b¾\b', '0.75', text)
-    text = re.sub(r'\b⅓\b', '0.33', text)
-    text = re.sub(r'\b⅔\b', '0.66', text)
-    text = re.sub(r'\b⅛\b', '0.125', text)
+    sub('fractions', r'\b1/2\b', '0.5')
+    sub('fractions', r'\b1/4\b', '0.25')
+    sub('fractions', r'\b3/4\b', '0.75')
+    sub('fractions', r'\b1/3\b', '0.33')
+    sub('fractions', r'\b2/3\b', '0.66')
+    sub('fractions', r'\b1/8\b', '0.125')
+    sub('fractions', r'\b½\b', '0.5')
+    sub('fractions', r'\b¼\b', '0.25')
+    sub('fractions', r'\b¾\b', '0.75')
+    sub('fractions', r'\b⅓\b', '0.33')
+    sub('fractions', r'\b⅔\b', '0.66')
+    sub('fractions', r'\b⅛\b', '0.125')
 
     # Normalize leading decimals with zeros (".5" to "0.5") if preceded by whitespace or line start
-    text = re.sub(r'(^|\s)\.(\d+)', r'\g<1>0.\2', text)
+    sub('numbers', r'(^|\s)\.(\d+)', r'\g<1>0.\2')
 
     # Normalize numbers like "1." to "1" (when not part of a decimal)
-    text = re.sub(r'\b(\d+)\.(?!\d)', r'\1', text)
+    sub('numbers', r'\b(\d+)\.(?!\d)', r'\1')
 
     # Remove "of a" between number and miles/kilometers (e.g., "0.75 of a miles" → "0.75 miles")
-    text = re.sub(r'(\d+(?:\.\d+)?)(\s+)of\s+a\s+(miles?|mile|kilometers?|km)\b', r'\1 \3', text, flags=re.IGNORECASE)
+    sub('numbers', r'(\d+(?:\.\d+)?)(\s+)of\s+a\s+(miles?|mile|kilometers?|km)\b', r'\1 \3', re.IGNORECASE)
 
     # Strip .0 from numbers like 5.0 miles to 5 miles
-    text = re.sub(r'(\d+)\.0\b', r'\1', text)
+    sub('numbers', r'(\d+)\.0\b', r'\1')
 
     # Normalize numbers directly before compass directions with no unit to miles
-    text = re.sub(
-        r'(\d+(?:\.\d+)?)\s*(north|south|east|west|northeast|northwest|southeast|southwest)\b',
-        r'\1 miles \2',
-        text,
-        flags=re.IGNORECASE
-    )
+    sub('numbers', r'(\d+(?:\.\d+)?)\s*(north|south|east|west|northeast|northwest|southeast|southwest)\b',
+        r'\1 miles \2', re.IGNORECASE)
 
     # --- Normalize patterns like "6mi.E." or "5kmW" → "6 miles east" ---
-    text = re.sub(
-        r'(\d+(\.\d+)?)(?:\s*)mi\.?\s*([nsew])\b',
+    sub('numbers', r'(\d+(\.\d+)?)(?:\s*)mi\.?\s*([nsew])\b',
         lambda m: f"{m.group(1)} miles {'north' if m.group(3).lower() == 'n' else 'south' if m.group(3).lower() == 's' else 'east' if m.group(3).lower() == 'e' else 'west'}",
-        text,
-        flags=re.IGNORECASE
-    )
-    text = re.sub(
-        r'(\d+(\.\d+)?)(?:\s*)km\.?\s*([nsew])\b',
+        re.IGNORECASE)
+    sub('numbers', r'(\d+(\.\d+)?)(?:\s*)km\.?\s*([nsew])\b',
         lambda m: f"{m.group(1)} kilometers {'north' if m.group(3).lower() == 'n' else 'south' if m.group(3).lower() == 's' else 'east' if m.group(3).lower() == 'e' else 'west'}",
-        text,
-        flags=re.IGNORECASE
-    )
+        re.IGNORECASE)
 
     # Remove all punctuation except for periods used in decimal numbers
-    text = re.sub(r'(?<!\d)\.(?!\d)', ' ', text)  # remove periods not part of decimal numbers
+    sub('punctuation', r'(?<!\d)\.(?!\d)', ' ')  # remove periods not part of decimal numbers
 
     # Preserve hyphens within known compound directions before stripping punctuation
-    DIRECTION_COMPOUNDS = [
-        'north-northeast', 'north-northwest', 'south-southeast', 'south-southwest',
-        'east-northeast', 'east-southeast', 'west-northwest', 'west-southwest'
-    ]
-    
-    for compound in DIRECTION_COMPOUNDS:
-        text = text.replace(compound, compound.replace('-', '___'))  # temp protect hyphens
-    
+    step('punctuation', 'protect compound direction hyphens', protect_compound_hyphens)
+
     # Now remove unwanted punctuation
-    text = re.sub(r'[^\w\s.]', ' ', text)
-    text = re.sub(r'(?<!\d)\.(?!\d)', ' ', text)
-    
+    sub('punctuation', r'[^\w\s.]', ' ')
+    sub('punctuation', r'(?<!\d)\.(?!\d)', ' ')
+
     # Restore hyphens
-    text = text.replace('___', '-')
+    step('punctuation', "restore '___' to '-'", lambda text: text.replace('___', '-'))
 
     # --- Normalize whitespace ---
-    text = re.sub(r'\s+', ' ', text)
+    sub('cleanup', r'\s+', ' ')
+    step('cleanup', 'strip', str.strip)
+
+    # --- Family triggers ---
+    # Every rule of units/highways/numbers needs a digit or one of the keywords, compass rules
+    # need a 1–3 letter n/s/e/w word, a glued "nof" or a direction word, fractions need '/' or a
+    # Unicode fraction. Word-list families are triggered by any of their own patterns.
+    triggers = {
+        'units': re.compile(r'\d|mi|km', re.IGNORECASE).search,
+        'highways': re.compile(r'\d|sh|hwy|highway', re.IGNORECASE).search,
+        'compass': re.compile(r'\b[nsew]{1,3}\b|[nsew]of|north|south|east|west', re.IGNORECASE).search,
+        'fractions': re.compile(r'[/½¼¾⅓⅔⅛]').search,
+        'numbers': re.compile(r'\d').search,
+    }
+    for family in ('remove_terms', 'abbreviations', 'ordinals', 'number_words', 'fraction_words'):
+        patterns = family_patterns[family]
+        union = '|'.join(f'(?:{pattern})' for pattern, _ in patterns)
+        triggers[family] = re.compile(union, patterns[0][1]).search
+
+    return rules, triggers
+
+
+def rule_blocks(rules, triggers):
+    """Runs of consecutive rules of one family as (trigger or None, first rule index, functions)."""
+    blocks = []
+    for i, (_, family, function) in enumerate(rules):
+        if blocks and rules[blocks[-1][1]][1] == family:
+            blocks[-1][2].append(function)
+        else:
+            blocks.append((triggers.get(family), i, [function]))
+    return blocks
+
+
+DIRECTION_COMPOUNDS = [
+    'north-northeast', 'north-northwest', 'south-southeast', 'south-southwest',
+    'east-northeast', 'east-southeast', 'west-northwest', 'west-southwest'
+]
+
+
+def drop_repeated_prefix(text):
+    """'Oklahoma City; near county line on W 10th street, Oklahoma City' → the part after ';'"""
+    if ";" in text:
+        prefix, rest = text.split(";", 1)
+        prefix = prefix.strip()
+        if prefix and prefix in rest:
+            text = rest.strip()
+    return text
+
+
+def protect_compound_hyphens(text):
+    """temp protect the hyphens of DIRECTION_COMPOUNDS from punctuation stripping"""
+    for compound in DIRECTION_COMPOUNDS:
+        text = text.replace(compound, compound.replace('-', '___'))
+    return text
+
+
+def preprocess(text, profiler=None):
+    """normalize, and apply regex modifications to locality text (PREPROCESS_RULES in order)"""
+    if pd.isnull(text):
+        return ""
+    if profiler is not None:
+        return profiler.run(text)
+
+    for trigger, _, functions in PREPROCESS_BLOCKS:
+        if trigger is not None and not trigger(text):
+            continue
+        for rule in functions:
+            text = rule(text)
+    return text
+
+
+class RuleProfiler:
+    """
+    --profile-rules: runs the preprocessing rules one by one, gated like preprocess(), and records
+    per rule the cumulative time, how many localities it changed or skipped (family trigger absent)
+    and the first few before/after samples. Trigger checks are timed per family.
+    """
 
-    return text.strip()
+    def __init__(self, rules, blocks, n_samples=3):
+        self.rules = rules
+        self.blocks = blocks
+        self.n_samples = n_samples
+        self.seconds = np.zeros(len(rules))
+        self.changed = np.zeros(len(rules), dtype=np.int64)
+        self.skipped = np.zeros(len(rules), dtype=np.int64)
+        self.trigger_seconds = np.zeros(len(rules))
+        self.samples = [[] for _ in rules]
+        self.texts = 0
+
+    def run(self, text):
+        self.texts += 1
+        for trigger, first, functions in self.blocks:
+            if trigger is not None:
+                start = time.perf_counter()
+                triggered = trigger(text)
+                self.trigger_seconds[first] += time.perf_counter() - start
+                if not triggered:
+                    self.skipped[first:first + len(functions)] += 1
+                    continue
+            for i, rule in enumerate(functions, first):
+                start = time.perf_counter()
+                result = rule(text)
+                self.seconds[i] += time.perf_counter() - start
+                if result != text:
+                    self.changed[i] += 1
+                    if len(self.samples[i]) < self.n_samples:
+                        self.samples[i].append((text, result))
+                text = result
+        return text
+
+    def report(self):
+        """One row per rule, slowest first: position, family, rule, seconds, share of time, rows changed, samples."""
+        rows = []
+        for i, (name, family, _) in enumerate(self.rules):
+            row = {
+                'position': i + 1,
+                'family': family,
+                'rule': name,
+                'seconds': round(self.seconds[i], 6),
+                'percent_of_time': round(100 * self.seconds[i] / max(self.seconds.sum(), 1e-12), 2),
+                'rows_changed': int(self.changed[i]),
+                'rows_skipped': int(self.skipped[i]),
+            }
+            for n in range(self.n_samples):
+                before, after = self.samples[i][n] if n < len(self.samples[i]) else ('', '')
+                row[f'before_{n + 1}'] = before
+                row[f'after_{n + 1}'] = after
+            rows.append(row)
+        report = pd.DataFrame(rows)
+        return report.sort_values(['seconds', 'position'], ascending=[False, True], kind='stable').reset_index(drop=True)
+
+    def write(self, report_file=None, top=10):
+        """Print the slowest rules and the rules that changed nothing; save the full report as CSV."""
+        report = self.report()
+        total = self.seconds.sum()
+        print(f"Rule profile: {len(self.rules)} rules on {self.texts:,} localities, {total:.2f} seconds in rules "
+              f"and {self.trigger_seconds.sum():.2f} seconds in family trigger checks.")
+        print(report.head(top)[['position', 'family', 'seconds', 'percent_of_time', 'rows_changed', 'rows_skipped',
+                                'rule']].to_string(index=False))
+        unused = int((report['rows_changed'] == 0).sum())
+        print(f"{unused} rule(s) changed no locality.")
+        if report_file:
+            report.to_csv(report_file, index=False)
+            print(f"Exported rule profile to: {report_file}")
+        return report
 
 
 def convert_m_unit(match):
@@ -406,15 +769,46 @@ def convert_m_unit(match):
     return f"{int(num) if num.is_integer() else num} {unit}"
 
 
+PREPROCESS_RULES, FAMILY_TRIGGERS = build_preprocess_rules()
+PREPROCESS_BLOCKS = rule_blocks(PREPROCESS_RULES, FAMILY_TRIGGERS)
+
+
+# --- Distance/direction patterns (compiled once) ---
+# Match number + optional unit + direction in order
+# Example matches: '5 miles north', '3.5 kilometers southwest'
+DISTANCE_DIRECTION_PATTERN = re.compile(
+    r'(\d+(?:\.\d+)?)\s*'                           # Number (with optional decimal)
+    r'(miles|kilometers|meters|feet)?[\s,]*'        # Optional unit
+    r'(north|south|east|west|'                      # Direction (simple and compound)
+    r'northeast|northwest|southeast|southwest)\b',
+    flags=re.IGNORECASE
+)
+
+# Fallback: first number + unit, and first direction, anywhere in the text
+FALLBACK_DISTANCE_PATTERN = re.compile(
+    r'\b(\d+(?:\.\d+)?)\s*(miles|kilometers|meters|feet)\b',
+    flags=re.IGNORECASE
+)
+FALLBACK_DIRECTION_PATTERN = re.compile(
+    r'\b(north|south|east|west|northeast|northwest|southeast|southwest)\b',
+    flags=re.IGNORECASE
+)
+
+
+def normalize_distance(number):
+    """'5.0' → '5', '0.50' → '0.5'"""
+    num = float(number)
+    if num.is_integer():
+        num = int(num)  # Convert to int if it's a whole number (e.g., 5.0 → 5)
+    return str(num)
+
+
 def normalize_matched_direction(matches):
     """normalizes units and integers of directions from locality text."""
     results = []
     for number, unit, direction in matches:
-        num = float(number)
-        if num.is_integer():
-            num = int(num)  # Convert to int if it's a whole number (e.g., 5.0 → 5)
         unit = unit.lower() if unit else ''  # Normalize unit (e.g., 'Miles' → 'miles')
-        results.append((str(num), direction.lower(), unit))  # Lowercase for consistency
+        results.append((normalize_distance(number), direction.lower(), unit))  # Lowercase for consistency
 
     return results
 
@@ -428,27 +822,16 @@ def fallback_direction(text):
             fallback_result: Returns number, direction, unit list of tuples.
     """
 
-    fallback_number = re.search(
-        r'\b(\d+(?:\.\d+)?)\s*(miles|kilometers|meters|feet)\b',
-        text,
-        flags=re.IGNORECASE
-    )
+    fallback_number = FALLBACK_DISTANCE_PATTERN.search(text)
 
     # Find first occurrence of a direction (e.g., "northwest")
-    fallback_direction = re.search(
-        r'\b(north|south|east|west|northeast|northwest|southeast|southwest)\b',
-        text,
-        flags=re.IGNORECASE
-    )
+    fallback_direction = FALLBACK_DIRECTION_PATTERN.search(text)
 
     # If both are found, assume this is a valid out-of-order distance-direction pair
     if fallback_number and fallback_direction:
-        number = float(fallback_number.group(1))
-        if number.is_integer():
-            number = int(number)
         unit = fallback_number.group(2).lower()
         direction = fallback_direction.group(1).lower()
-        return [(str(number), direction, unit)]
+        return [(normalize_distance(fallback_number.group(1)), direction, unit)]
     else:
         return []
 
@@ -466,18 +849,7 @@ def extract_distance_direction(text):
     if pd.isnull(text):
         return []
 
-    # --- Main extraction pattern ---
-    # Match number + optional unit + direction in order
-    # Example matches: '5 miles north', '3.5 kilometers southwest'
-    pattern = re.compile(
-        r'(\d+(?:\.\d+)?)\s*'                           # Number (with optional decimal)
-        r'(miles|kilometers|meters|feet)?[\s,]*'        # Optional unit
-        r'(north|south|east|west|'                      # Direction (simple and compound)
-        r'northeast|northwest|southeast|southwest)\b',
-        flags=re.IGNORECASE
-    )
-
-    matches = pattern.findall(text)
+    matches = DISTANCE_DIRECTION_PATTERN.findall(text)
 
     #normalize matched results
     results = normalize_matched_direction(matches)
@@ -488,29 +860,161 @@ def extract_distance_direction(text):
         return results
 
     # --- Fallback logic (if no standard pattern was matched) ---
-    fall_back_result = fallback_direction(text)
+    return fallback_direction(text)
 
-    if len(fall_back_result) == 0:
-        pass
-    else:
-        return fall_back_result
 
-    # If nothing found, return empty list
-    return []
+class DistanceDirections:
+    """
+    Compact columnar storage of the (distance, direction, unit) signatures of every row:
+    one flat record array (float32 distance, uint8 direction code, uint8 unit code) plus
+    per-row offsets, so row i owns records offsets[i]:offsets[i + 1].
+    Records within a row are sorted by direction, then distance (as extract_distance_direction does).
+    """
+    DIRECTIONS = ('north', 'south', 'east', 'west', 'northeast', 'northwest', 'southeast', 'southwest')
+    UNITS = ('', 'miles', 'kilometers', 'meters', 'feet')
+
+    def __init__(self, offsets, distance, direction, unit):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.distance = np.asarray(distance, dtype=np.float32)
+        self.direction = np.asarray(direction, dtype=np.uint8)
+        self.unit = np.asarray(unit, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def signatures(self):
+        """
+        One int64 hash per row of its whole record sequence (0 for rows with no records),
+        so rows with identical signatures can be compared, grouped and factorized as plain integers.
+        """
+        # each record packs losslessly into 48 bits: float32 bits | direction | unit
+        codes = ((self.distance.view(np.uint32).astype(np.uint64) << np.uint64(16))
+                 | (self.direction.astype(np.uint64) << np.uint64(8))
+                 | self.unit.astype(np.uint64))
+        counts = self.counts()
+        starts = self.offsets[:-1]
+        h = np.zeros(len(self), dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            for k in range(int(counts.max()) if len(counts) else 0):
+                rows = np.flatnonzero(counts > k)
+                x = h[rows] ^ (codes[starts[rows] + k] + np.uint64(0x9E3779B97F4A7C15))
+                # splitmix64 finalizer
+                x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+                x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+                h[rows] = x ^ (x >> np.uint64(31))
+        return h.view(np.int64)
+
+    def distance_strings(self):
+        """Shortest decimal text for each record's distance ('5', '0.5', '0.33')."""
+        uniq, inverse = np.unique(self.distance, return_inverse=True)
+        text = np.array([np.format_float_positional(v, trim='-') for v in uniq], dtype=object)
+        return text[inverse.ravel()]
+
+    def to_strings(self, rows=None):
+        """Readable per-row text, e.g. '5 miles east; 0.5 miles north' ('' when a row has no records)."""
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        distances = self.distance_strings()
+        directions = np.array(self.DIRECTIONS, dtype=object)[self.direction]
+        units = np.array(self.UNITS, dtype=object)[self.unit]
+        records = pd.Series(np.where(
+            self.unit == 0,
+            distances + ' ' + directions,
+            distances + ' ' + units + ' ' + directions
+        ))
+
+        owner = np.repeat(np.arange(len(self)), self.counts())
+        joined = records.groupby(owner).agg('; '.join)
+        return joined.reindex(rows, fill_value='').to_numpy()
+
+    def to_tuples(self, i):
+        """Row i as the (distance, direction, unit) string tuples extract_distance_direction returns."""
+        a, b = self.offsets[i], self.offsets[i + 1]
+        return [
+            (np.format_float_positional(self.distance[k], trim='-'), self.DIRECTIONS[self.direction[k]], self.UNITS[self.unit[k]])
+            for k in range(a, b)
+        ]
+
+    def to_arrow(self, rows=None):
+        """list<struct<distance: float32, direction: dictionary, unit: dictionary>> Arrow array."""
+        import pyarrow as pa
+
+        values = pa.StructArray.from_arrays(
+            [
+                pa.array(self.distance, pa.float32()),
+                pa.DictionaryArray.from_arrays(pa.array(self.direction.astype(np.int8)), pa.array(self.DIRECTIONS)),
+                pa.DictionaryArray.from_arrays(pa.array(self.unit.astype(np.int8)), pa.array(self.UNITS)),
+            ],
+            names=['distance', 'direction', 'unit'],
+        )
+        array = pa.ListArray.from_arrays(pa.array(self.offsets.astype(np.int32)), values)
+        return array if rows is None else array.take(pa.array(np.asarray(rows, dtype=np.int64)))
 
 
-def preprocess_localities(df, grouping_field):
+def extract_distance_directions(texts):
+    """
+    Bulk version of extract_distance_direction over a whole Series, same records per row,
+    returned as a DistanceDirections table.
+    One extractall pass for the main pattern, one extract pass per fallback pattern on the
+    rows with no main match.
+    """
+    texts = pd.Series(texts).fillna('').reset_index(drop=True)
+    n = len(texts)
+
+    # --- Main pattern, all matches of all rows ---
+    found = texts.str.extractall(DISTANCE_DIRECTION_PATTERN)
+    rows = found.index.get_level_values(0).to_numpy(np.int64)
+    numbers = found[0]
+    units = found[1].fillna('').str.lower()
+    directions = found[2].str.lower()
+
+    # --- Fallback for rows without any main match ---
+    missing = np.ones(n, dtype=bool)
+    missing[rows] = False
+    rest = texts[missing]
+    fb_distance = rest.str.extract(FALLBACK_DISTANCE_PATTERN)
+    fb_direction = rest.str.extract(FALLBACK_DIRECTION_PATTERN)[0]
+    fb_ok = fb_distance[0].notna() & fb_direction.notna()
+
+    rows = np.concatenate([rows, fb_ok[fb_ok].index.to_numpy(np.int64)])
+    numbers = pd.concat([numbers, fb_distance.loc[fb_ok, 0]], ignore_index=True)
+    units = pd.concat([units, fb_distance.loc[fb_ok, 1].str.lower()], ignore_index=True)
+    directions = pd.concat([directions, fb_direction[fb_ok].str.lower()], ignore_index=True)
+
+    # --- Encode: distinct number strings are parsed once ---
+    uniq_numbers = numbers.unique()
+    distance_values = numbers.map(dict(zip(uniq_numbers, map(float, uniq_numbers)))).to_numpy(np.float64)
+    direction_codes = directions.map({d: i for i, d in enumerate(DistanceDirections.DIRECTIONS)}).to_numpy(np.uint8)
+    unit_codes = units.map({u: i for i, u in enumerate(DistanceDirections.UNITS)}).to_numpy(np.uint8)
+
+    # --- Sort each row by direction, then distance (stable, like list.sort) ---
+    order = np.lexsort((distance_values, directions.to_numpy().astype(str), rows))
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=n))))
+    return DistanceDirections(offsets, distance_values[order], direction_codes[order], unit_codes[order])
+
+
+def preprocess_localities(df, grouping_field, profile_rules=False, rules_report=None):
     """
         applies the preprocess and extract_distance_direction steps to localities
-        and returns grouped dataframe
+        with profile_rules, times every preprocessing rule and reports it (saved to rules_report if given)
+        returns:
+            grouped dataframe (one row per grouping_field, with a 'dd_signature' hash column)
+            DistanceDirections table aligned with grouped's rows
     """
     grouped = df.drop_duplicates(subset=grouping_field).copy()
     grouped = grouped.reset_index(drop=True)
-    grouped['normalized_locality'] = grouped['locality'].apply(preprocess)
-    grouped['distance_direction'] = grouped['normalized_locality'].str.replace('*', '', regex=False).apply(
-        extract_distance_direction)
+    profiler = RuleProfiler(PREPROCESS_RULES, PREPROCESS_BLOCKS) if profile_rules else None
+    grouped['normalized_locality'] = grouped['locality'].apply(preprocess, profiler=profiler)
+    directions = extract_distance_directions(
+        grouped['normalized_locality'].str.replace('*', '', regex=False))
+    grouped['dd_signature'] = directions.signatures()
 
-    return grouped
+    if profiler is not None:
+        profiler.write(rules_report)
+
+    return grouped, directions
 
 
 # --- TF-IDF setup ---
@@ -542,23 +1046,97 @@ def get_important_phrases():
     ]
 
 
+def make_tfidf_vectorizer():
+    """Unfitted TfidfVectorizer with the custom tokenizer and stop words."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    return TfidfVectorizer(
+        tokenizer=custom_tokenizer,
+        lowercase=False,
+        stop_words=get_custom_stop_words()
+    )
+
+
 def build_tfidf_matrix(grouped):
     """
     Builds a TF-IDF matrix from normalized localities in the 'grouped' DataFrame.
     Returns:
         id_matrix (sparse matrix), vectorizer (TfidfVectorizer)
     """
-    vectorizer = TfidfVectorizer(
-        tokenizer=custom_tokenizer,
-        lowercase=False,
-        stop_words=get_custom_stop_words()
-    )
+    vectorizer = make_tfidf_vectorizer()
 
     # --- Initial TF-IDF matrix on pre-alias normalized locality ---
     id_matrix = vectorizer.fit_transform(grouped['normalized_locality'])
     return id_matrix, vectorizer
 
 
+def vocabulary_frequencies(id_matrix, vectorizer):
+    """Document frequency of every vocabulary token, in vocabulary order."""
+    doc_freq = np.bincount(id_matrix.tocsr().indices, minlength=id_matrix.shape[1])
+    return {token: int(doc_freq[idx]) for token, idx in vectorizer.vocabulary_.items()}
+
+
+def analyze_locality(text, stop_words):
+    """custom_tokenizer tokens minus stop words: the same terms TfidfVectorizer counts."""
+    return [tok for tok in custom_tokenizer(text) if tok not in stop_words]
+
+
+def token_document_frequencies(texts, chunksize=50_000):
+    """
+    Document frequency of every token, streamed over the texts in chunks without building a
+    TF-IDF matrix. Tokens are kept in order of first appearance, like TfidfVectorizer.vocabulary_.
+    """
+    stop_words = set(get_custom_stop_words())
+    token_freq = {}
+    for start in range(0, len(texts), chunksize):
+        for text in texts.iloc[start:start + chunksize]:
+            for tok in dict.fromkeys(analyze_locality(text, stop_words)):
+                token_freq[tok] = token_freq.get(tok, 0) + 1
+    return token_freq
+
+
+def hashed_tfidf_matrix(texts, n_features=2 ** 20, chunksize=50_000):
+    """
+    Fixed-memory TF-IDF for the hashing feature mode: HashingVectorizer term counts built
+    chunk by chunk, a separately computed smoothed IDF (document frequencies weighted by
+    'multiplicity' when present), L2 normalization, then the directional/numeric re-weighting
+    applied through a hashed weight vector. No vocabulary is kept; tokens that share a hash
+    bucket with a directional or numeric token are re-weighted too.
+    """
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.preprocessing import normalize
+    from scipy.sparse import csr_matrix, vstack
+    stop_words = set(get_custom_stop_words())
+    hasher = HashingVectorizer(
+        analyzer=lambda tokens: tokens,
+        n_features=n_features,
+        alternate_sign=False,
+        norm=None
+    )
+    weights = texts['multiplicity'].to_numpy(np.float64) if 'multiplicity' in texts.columns else np.ones(len(texts))
+    localities = texts['normalized_locality']
+
+    chunks = []
+    doc_freq = np.zeros(n_features)
+    numeric_tokens = set()
+    for start in range(0, len(texts), chunksize):
+        tokens = [analyze_locality(t, stop_words) for t in localities.iloc[start:start + chunksize]]
+        numeric_tokens.update(tok for toks in tokens for tok in toks if re.fullmatch(r'\d+(\.\d+)?', tok))
+        counts = hasher.transform(tokens).tocsr()
+        doc_freq += (counts > 0).T.astype(np.float64) @ weights[start:start + chunksize]
+        chunks.append(counts)
+
+    counts = vstack(chunks).tocsr() if chunks else csr_matrix((0, n_features))
+    # same smoothed idf as TfidfVectorizer: ln((1 + n) / (1 + df)) + 1
+    idf = np.log((1 + weights.sum()) / (1 + doc_freq)) + 1
+    id_matrix = normalize(counts.multiply(idf).tocsr())
+
+    # --- Re-weight directional and numeric tokens through their hash buckets ---
+    boosted = get_important_phrases() + sorted(numeric_tokens)
+    token_weights = np.ones(n_features)
+    token_weights[hasher.transform([[tok] for tok in boosted]).indices] = 1.10
+    return id_matrix.multiply(token_weights).tocsr()
+
+
 def dynamic_threshold(token1, token2, base_threshold=75, max_threshold=90):
     """
     Calculates a dynamic fuzzy match threshold based on average token length.
@@ -573,15 +1151,16 @@ def dynamic_threshold(token1, token2, base_threshold=75, max_threshold=90):
         return base_threshold + ((avg_len - 5) / 10) * (max_threshold - base_threshold)
 
 
-def fuzzy_alias_tokens(id_matrix, vectorizer):
+def fuzzy_alias_tokens(token_freq, decisions=None, verbose=False, seed=None):
     """
-     Identifies and merges similar tokens using fuzzy matching on the TF-IDF vocabulary.
+     Identifies and merges similar tokens using fuzzy matching on the vocabulary.
      Protects directional, ordinal, township codes, and key adjectives.
+     token_freq: {token: document frequency}, from vocabulary_frequencies or token_document_frequencies.
+     seed: {other: canonical} aliases to start from (e.g. a saved -aliases.csv); their tokens aren't aliased again.
+     decisions: list that receives one row per alias (see ALIAS_REPORT_COLUMNS); verbose also prints each one.
     """
-    vocab = vectorizer.vocabulary_
-
-    token_freq = {token: id_matrix[:, idx].nnz for token, idx in vocab.items()}  # document frequency
-    vocab_keys = list(vocab.keys())
+    from rapidfuzz import fuzz
+    vocab_keys = list(token_freq.keys())
 
 
     protected_tokens = set([
@@ -594,7 +1173,27 @@ def fuzzy_alias_tokens(id_matrix, vectorizer):
     ])
 
     township_pattern = r'^[trs]\d{1,3}[nsew]?$'
-    merged = {}
+    merged = dict(seed or {})
+
+    def record(other, canonical, score=None, threshold=None, source='fuzzy'):
+        if verbose:
+            if score is None:
+                print(f"Aliasing '{other}' to '{canonical}' ({source})")
+            else:
+                print(f"Aliasing '{other}' ({token_freq.get(other, 0)}) to '{canonical}' ({token_freq.get(canonical, 0)}) (score {score:.2f} ≥ {threshold:.2f})")
+        if decisions is not None:
+            decisions.append({
+                'other': other,
+                'canonical': canonical,
+                'other_frequency': token_freq.get(other, 0),
+                'canonical_frequency': token_freq.get(canonical, 0),
+                'score': None if score is None else round(score, 2),
+                'threshold': None if threshold is None else round(threshold, 2),
+                'source': source,
+            })
+
+    for other, canonical in merged.items():
+        record(other, canonical, source='seed')
 
     # --- Fuzzy token aliasing ---
     for i in range(len(vocab_keys)):
@@ -652,11 +1251,30 @@ def fuzzy_alias_tokens(id_matrix, vectorizer):
                 if other in protected_tokens or other in merged:
                     continue
 
-                print(f"Aliasing '{other}' ({token_freq.get(other, 0)}) to '{canonical}' ({token_freq.get(canonical, 0)}) (score {score:.2f} ≥ {threshold:.2f})")
+                record(other, canonical, score, threshold)
                 merged[other] = canonical
 
     return merged
 
+
+ALIAS_REPORT_COLUMNS = ['other', 'canonical', 'other_frequency', 'canonical_frequency', 'score', 'threshold', 'source']
+
+
+def alias_report_frame(decisions):
+    """fuzzy_alias_tokens decisions as the -aliases.csv table (seeded aliases have no score/threshold)"""
+    return pd.DataFrame(decisions, columns=ALIAS_REPORT_COLUMNS)
+
+
+def load_alias_map(path):
+    """{other: canonical} from an -aliases.csv report (or any CSV with those two columns); raises ValueError"""
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Alias map not found: {path}")
+    table = pd.read_csv(path, dtype=str, keep_default_na=False)
+    if 'other' not in table.columns or 'canonical' not in table.columns:
+        raise ValueError(f"Alias map {path} must contain 'other' and 'canonical' columns.")
+    table = table[(table['other'] != '') & (table['canonical'] != '')]
+    return dict(zip(table['other'], table['canonical']))
+
 def apply_aliases(text, alias_map):
     """ Apply alias substitutions into normalized locality ---"""
     tokens = text.split()
@@ -670,77 +1288,436 @@ def apply_aliases(text, alias_map):
 
     return ' '.join(result)
 
+def collapse_duplicate_texts(grouped, enabled=True):
+    """
+    Collapse rows whose alias-applied normalized_locality (and distance/direction signature)
+    are identical to one representative text with a multiplicity count.
+    Adds grouped['text_id'] (row → unique text) and returns the unique-text frame.
+
+    Texts with no tokens left after stop words have an all-zero TF-IDF vector, which is
+    similar to nothing (itself included), so those rows are never collapsed.
+    """
+    if not enabled:
+        grouped['text_id'] = np.arange(len(grouped))
+        return grouped[['normalized_locality']].reset_index(drop=True)
+
+    stop_words = set(get_custom_stop_words())
+    norm = grouped['normalized_locality']
+    uniq_norm = pd.unique(norm)
+    has_terms = dict(zip(uniq_norm, (any(tok not in stop_words for tok in custom_tokenizer(t)) for t in uniq_norm)))
+
+    keys, _ = pd.factorize(pd.Series(list(zip(norm, grouped['dd_signature']))))
+    keys = np.where(norm.map(has_terms).to_numpy(bool), keys, -1 - np.arange(len(grouped)))
+    text_ids, _ = pd.factorize(keys)
+
+    grouped['text_id'] = text_ids
+    _, first_rows = np.unique(text_ids, return_index=True)
+    texts = grouped.iloc[first_rows][['normalized_locality']].reset_index(drop=True)
+    texts['multiplicity'] = np.bincount(text_ids)
+
+    print(f"Collapsed {len(grouped):,} rows to {len(texts):,} unique normalized localities.")
+    return texts
+
+
+def broadcast_text_groups(grouped, texts):
+    """Copy the group columns assigned to unique texts back onto every row via text_id."""
+    tid = grouped['text_id'].to_numpy()
+    for col in ('Suggested_ID', 'Group_Base', 'Group_Sub'):
+        grouped[col] = texts[col].to_numpy()[tid]
+    return grouped
+
+
 def rebuild_tfidf_on_alias(grouped, vectorizer):
-    """ Rebuild TF-IDF matrix on alias-applied text"""
-    id_matrix = vectorizer.fit_transform(grouped['normalized_locality'])
-    vocab = vectorizer.vocabulary_
+    """
+    Rebuild TF-IDF matrix on alias-applied text.
+    When `grouped` is a collapsed unique-text frame (has 'multiplicity'), document
+    frequencies are weighted by multiplicity so the IDF matches the uncollapsed data.
+    """
+    from sklearn.base import clone
+    from sklearn.preprocessing import normalize
+    if 'multiplicity' in grouped.columns:
+        counter = clone(vectorizer).set_params(use_idf=False, norm=None)
+        counts = counter.fit_transform(grouped['normalized_locality'])
+        weights = grouped['multiplicity'].to_numpy(np.float64)
+        n_docs = weights.sum()
+        doc_freq = (counts > 0).T.astype(np.float64) @ weights
+        # same smoothed idf as TfidfVectorizer: ln((1 + n) / (1 + df)) + 1
+        idf = np.log((1 + n_docs) / (1 + doc_freq)) + 1
+        id_matrix = normalize(counts.multiply(idf).tocsr())
+        vocab = counter.vocabulary_
+    else:
+        id_matrix = vectorizer.fit_transform(grouped['normalized_locality'])
+        vocab = vectorizer.vocabulary_
+
     important_phrases = get_important_phrases()
     # --- Re-weight directional and numeric tokens ---
+    token_weights = np.ones(len(vocab))
     for token, idx in vocab.items():
         if token in important_phrases or re.fullmatch(r'\d+(\.\d+)?', token):
-            id_matrix[:, idx] *= 1.10
-    return id_matrix
+            token_weights[idx] = 1.10
+    return id_matrix.multiply(token_weights).tocsr()
 
 # --- Cosine similarity ---
-def group_by_similarity(grouped, id_matrix):
+def build_neighbor_graph(id_matrix, threshold, block_size=2048, block_entries=1 << 24):
+    """
+    Sparse symmetric graph of cosine similarities ≥ threshold (edge weights kept, no self-loops).
+    Built from row blocks of the sparse product, so memory follows the number of edges, not N².
+    Blocks hold at most block_entries products (rows × N): localities sharing common tokens make
+    the product of a block nearly dense before it is thresholded.
+    """
+    from sklearn.preprocessing import normalize
+    from scipy.sparse import csr_matrix
+    normalized = normalize(id_matrix.tocsr())
+    transposed = normalized.T.tocsc()
+    n = normalized.shape[0]
+    block_size = max(1, min(block_size, block_entries // max(n, 1)))
+    rows, cols, weights = [], [], []
+    for start in range(0, n, block_size):
+        block = normalized[start:start + block_size] @ transposed
+        block_rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr)) + start
+        keep = (block.data >= threshold) & (block_rows != block.indices)
+        rows.append(block_rows[keep])
+        cols.append(block.indices[keep])
+        weights.append(block.data[keep])
+        del block, block_rows
+
+    if rows:
+        rows, cols, weights = np.concatenate(rows), np.concatenate(cols), np.concatenate(weights)
+    return csr_matrix((weights, (rows, cols)), shape=(n, n))
+
+
+def carve_groups(graph, radius, seed_order=None):
+    """
+    Split a neighbor graph into groups of at most `radius` hops from each group's seed
+    (so at most 2 × radius hops across). Seeds are the records not yet grouped, taken in
+    seed_order (default: row order, which makes the groups depend on it; see carving_order).
     """
-    Assign Suggested_ID and Grouper_ID using cosine similarity groupings.
+    n = graph.shape[0]
+    labels = np.full(n, -1, dtype=np.int64)
+    next_label = 0
+    for seed in range(n) if seed_order is None else seed_order:
+        if labels[seed] != -1:
+            continue
+        labels[seed] = next_label
+        frontier = np.array([seed])
+        for _ in range(radius):
+            neighbors = np.unique(graph[frontier].indices)
+            frontier = neighbors[labels[neighbors] == -1]
+            if len(frontier) == 0:
+                break
+            labels[frontier] = next_label
+        next_label += 1
+    return labels
+
+
+def carving_order(graph, texts):
+    """
+    Seed order for carve_groups that doesn't depend on row order: the records with the most
+    neighbors first, ties broken by their normalized text.
+    """
+    degree = np.diff(graph.tocsr().indptr)
+    _, text_rank = np.unique(np.asarray(texts).astype(str), return_inverse=True)
+    return np.lexsort((text_rank.ravel(), -degree))
+
+
+def rescore_borderline_pairs(texts, id_matrix, low=0.70, high=0.90, weight=0.5, score_cutoff=50):
+    """
+    Second scoring stage for pairs whose cosine similarity falls in the borderline band [low, high):
+    each candidate pair's normalized localities are compared with RapidFuzz token_set_ratio
+    (scored in bulk, all cores) and the score becomes (1 - weight) × cosine + weight × ratio / 100.
+    String scores below score_cutoff count as 0, so a pair already above the grouping threshold
+    (cosine 0.85–0.90) with a ratio below the cutoff drops to about (1 - weight) × cosine ≈ 0.45
+    and is removed. Only candidate pairs are scored, so the cost follows the number of borderline
+    pairs, not N².
+    Returns the blended scores as an upper-triangular sparse matrix (row < col).
+    """
+    from rapidfuzz import fuzz, process
+    from scipy.sparse import csr_matrix, triu
+    start_time = time.time()
+    n = id_matrix.shape[0]
+    candidates = triu(build_neighbor_graph(id_matrix, low), k=1).tocoo()
+    keep = candidates.data < high
+    rows, cols, cosine = candidates.row[keep], candidates.col[keep], candidates.data[keep]
+
+    localities = texts['normalized_locality'].to_numpy()
+    ratios = process.cpdist(
+        localities[rows], localities[cols],
+        scorer=fuzz.token_set_ratio,
+        score_cutoff=score_cutoff,
+        workers=-1
+    ) if len(rows) else np.zeros(0)
+    blended = (1 - weight) * cosine + weight * np.asarray(ratios, dtype=np.float64) / 100
+
+    print(f"Rescored {len(rows):,} borderline pairs ({low:.2f} ≤ cosine < {high:.2f}) "
+          f"in {time.time() - start_time:.2f} seconds.")
+    return csr_matrix((blended, (rows, cols)), shape=(n, n))
+
+
+def apply_rescored_pairs(graph, rescored, threshold):
+    """
+    Replace the weights of rescored pairs in a symmetric neighbor graph with their blended scores,
+    keeping only edges still ≥ threshold (rescored pairs may enter or leave the graph).
+    """
+    from scipy.sparse import csr_matrix
+    pairs = rescored.tocoo()
+    rows = np.concatenate([pairs.row, pairs.col])
+    cols = np.concatenate([pairs.col, pairs.row])
+    scores = np.concatenate([pairs.data, pairs.data])
+    # drop by position, not by score: a pair can blend to exactly 0 (weight 1, ratio below the cutoff)
+    rescored_pattern = csr_matrix((np.ones(len(rows)), (rows, cols)), shape=graph.shape)
+    graph = (graph - graph.multiply(rescored_pattern)).tocsr()
+    keep = scores >= threshold
+    graph = graph + csr_matrix((scores[keep], (rows[keep], cols[keep])), shape=graph.shape)
+    graph.eliminate_zeros()
+    return graph.tocsr()
+
+
+def apply_rescored_similarity(similarity, rescored):
+    """Write blended pair scores into the dense similarity matrix (both triangles)."""
+    pairs = rescored.tocoo()
+    similarity[pairs.row, pairs.col] = pairs.data
+    similarity[pairs.col, pairs.row] = pairs.data
+    if isinstance(similarity, np.memmap):
+        similarity.flush()
+    return similarity
+
+
+def build_scoring_graph(id_matrix, threshold, rescored=None):
+    """Neighbor graph ≥ threshold, with rescored pairs' blended scores in place of their cosine."""
+    graph = build_neighbor_graph(id_matrix, threshold)
+    if rescored is not None:
+        graph = apply_rescored_pairs(graph, rescored, threshold)
+    return graph
+
+
+def group_by_components(graph, threshold, max_diameter=None, texts=None):
+    """
+    Group records as connected components of the neighbor graph's edges ≥ threshold
+    (independent of row order). With max_diameter, components are carved into groups whose
+    members are within max_diameter // 2 hops of a seed; with texts (the normalized localities)
+    seeds follow carving_order, so the groups stay independent of row order, else row order.
+    Returns group numbers 1..G in order of each group's first record.
     """
-    similarity = cosine_similarity(id_matrix)
+    from scipy.sparse.csgraph import connected_components
+    graph = graph.tocsr(copy=True)
+    graph.data[graph.data < threshold] = 0
+    graph.eliminate_zeros()
+    if max_diameter:
+        seed_order = carving_order(graph, texts) if texts is not None else None
+        labels = carve_groups(graph, max(1, max_diameter // 2), seed_order)
+    else:
+        _, labels = connected_components(graph, directed=False)
 
-    threshold = 0.85
+    # number groups by first appearance, like the greedy mode
+    _, first_rows, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    rank = np.empty(len(first_rows), dtype=np.int64)
+    rank[np.argsort(first_rows, kind='stable')] = np.arange(1, len(first_rows) + 1)
+    return rank[inverse.ravel()]
 
-    suggested_ids = [-1] * len(grouped)
-    group_counter = 1
 
-    for i in range(len(grouped)):
-        if suggested_ids[i] != -1:
-            continue
-        suggested_ids[i] = group_counter
-        for j in range(i + 1, len(grouped)):
-            if suggested_ids[j] == -1 and similarity[i, j] >= threshold:
-                suggested_ids[j] = group_counter
-        group_counter += 1
+def compute_similarity(id_matrix, dtype=np.float64, scratch_dir=None, block_size=2048):
+    """
+    Dense cosine similarity of all records.
+    float64 in RAM (no scratch_dir) is plain cosine_similarity; otherwise the matrix is filled
+    in row blocks, in `dtype`, and with scratch_dir into a numpy.memmap file there so it can
+    spill to disk. Remove that file (scratch_file) with release_scratch_file when done (in a finally block, so that
+    an error or Ctrl+C in a later stage doesn't leave it behind).
+    """
+    from sklearn.metrics.pairwise import cosine_similarity
+    from sklearn.preprocessing import normalize
+    dtype = np.dtype(dtype)
+    if scratch_dir is None and dtype == np.float64:
+        return cosine_similarity(id_matrix)
+
+    normalized = normalize(id_matrix.tocsr())
+    transposed = normalized.T.tocsc()
+    n = normalized.shape[0]
+
+    if scratch_dir is None:
+        similarity = np.empty((n, n), dtype=dtype)
+    else:
+        os.makedirs(scratch_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix='grouper-similarity-', suffix='.dat', dir=scratch_dir)
+        os.close(fd)
+        similarity = np.memmap(path, dtype=dtype, mode='w+', shape=(max(n, 1), max(n, 1)))[:n, :n]
+        print(f"Writing {n:,} × {n:,} {dtype.name} similarity matrix to {path}")
+
+    for start in range(0, n, block_size):
+        similarity[start:start + block_size] = (normalized[start:start + block_size] @ transposed).toarray()
+
+    if isinstance(similarity, np.memmap):
+        similarity.flush()
+    return similarity
+
+
+def scratch_file(similarity):
+    """Path of the file behind a memory-mapped similarity matrix; None for in-RAM arrays and graphs."""
+    return getattr(similarity, 'filename', None)
+
+
+def release_scratch_file(path):
+    """
+    Delete a similarity scratch file (no-op for None). Drop the references to the matrix first, so
+    numpy closes its mapping: POSIX can remove a mapped file, Windows can't, so a file still mapped
+    there (e.g. by an exception's traceback) is removed at exit instead.
+    """
+    if not path or not os.path.exists(path):
+        return
+    try:
+        os.remove(path)
+    except PermissionError:
+        atexit.register(remove_scratch_file, path)
+
+
+def remove_scratch_file(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        print(f"Could not remove scratch file {path}: {e}")
+
+
+def group_by_similarity(grouped, id_matrix, threshold=0.85, method='greedy', max_diameter=None,
+                        similarity_dtype=np.float64, scratch_dir=None, rescored=None, singleton_similarity=0.80):
+    """
+    Assign Suggested_ID and the integer group columns (Group_Base, Group_Sub) using cosine similarity groupings.
+        greedy: row j joins row i's group when directly ≥ threshold similar to its first member (row order matters)
+        components: connected components of the ≥ threshold neighbor graph (see group_by_components)
+    rescored: optional blended scores for borderline pairs (see rescore_borderline_pairs), used in place of their cosine.
+    Also returns what the later stages score against: for greedy the dense similarity matrix (see
+    compute_similarity), for components the neighbor graph down to min(threshold, singleton_similarity),
+    so that mode never builds an N × N matrix.
+    """
+    if method == 'components':
+        similarity = build_scoring_graph(id_matrix, min(threshold, singleton_similarity), rescored)
+        suggested_ids = group_by_components(similarity, threshold, max_diameter,
+                                            grouped['normalized_locality'].to_numpy())
+    else:
+        similarity = compute_similarity(id_matrix, similarity_dtype, scratch_dir)
+        try:
+            if rescored is not None:
+                similarity = apply_rescored_similarity(similarity, rescored)
+
+            n = len(grouped)
+            suggested_ids = np.full(n, -1, dtype=np.int64)
+            group_counter = 1
+
+            for i in range(n):
+                if suggested_ids[i] != -1:
+                    continue
+                suggested_ids[i] = group_counter
+                # one row read per group leader (sequential on a memmap)
+                later = np.flatnonzero((similarity[i, i + 1:] >= threshold) & (suggested_ids[i + 1:] == -1)) + i + 1
+                suggested_ids[later] = group_counter
+                group_counter += 1
+        except BaseException:
+            path = scratch_file(similarity)
+            del similarity
+            release_scratch_file(path)
+            raise
 
     grouped['Suggested_ID'] = suggested_ids
-    grouped['Grouper_ID'] = grouped['Suggested_ID'].astype(str)
+    grouped['Group_Base'] = np.asarray(suggested_ids, dtype=np.int32)
+    grouped['Group_Sub'] = np.zeros(len(grouped), dtype=np.int32)
 
     return grouped, similarity
 
 
+def group_keys(grouped):
+    """One int64 key per row for the (Group_Base, Group_Sub) pair: base in the high 32 bits, sub in the low."""
+    return (grouped['Group_Base'].to_numpy(np.int64) << 32) | grouped['Group_Sub'].to_numpy(np.int64)
+
+
+def format_grouper_ids(grouped):
+    """Render the integer group columns as the dotted Grouper_ID strings used in output ('12', '12.3', '0')."""
+    base = grouped['Group_Base'].astype(str)
+    sub = grouped['Group_Sub']
+    return base.where(sub == 0, base + '.' + sub.astype(str))
+
+
 def assign_confidence_scores(grouped, similarity):
     """
         Compute average intra-group cosine similarity as a 0–100 confidence score.
+        `similarity` is indexed by grouped['text_id']; rows sharing a text count once per row.
     """
-    group_members = (
-        grouped
-        .drop(columns=['Grouper_ID'])
-        .groupby(grouped['Grouper_ID'])
-        .apply(lambda df: df.index.tolist())
-        .to_dict()
-    )
+    _, group_codes = np.unique(group_keys(grouped), return_inverse=True)
+    text_ids = grouped['text_id'].to_numpy()
+    order = np.argsort(group_codes, kind='stable')
+    sizes = np.bincount(group_codes)
+    bounds = np.concatenate(([0], np.cumsum(sizes)))
+
+    # If the group has only one member, confidence is 1
+    confidence_scores = np.ones(len(grouped))
+
+    for g in np.flatnonzero(sizes > 1):
+        members = order[bounds[g]:bounds[g + 1]]
+        uniq, inverse, counts = np.unique(text_ids[members], return_inverse=True, return_counts=True)
+        block = np.asarray(similarity[np.ix_(uniq, uniq)], dtype=np.float64)
+        # Sum of similarity to every member (duplicates weighted by count), minus the row itself
+        totals = block @ counts - block.diagonal()
+        # Calculate average similarity to other members of the group
+        confidence_scores[members] = totals[inverse] / (len(members) - 1)
 
-    confidence_scores = []
+    grouped['Confidence'] = np.round(confidence_scores * 100, 1)
+    return grouped
 
-    for idx in range(len(grouped)):
-        group_id = grouped.iloc[idx]['Grouper_ID']
-        members = group_members[group_id]
 
-        # If the group has only one member, confidence is 1
-        if len(members) == 1:
-            confidence_scores.append(1.0)
-            continue
+def assign_centroid_confidence(grouped, id_matrix, rescored=None):
+    """
+        The same Confidence as assign_confidence_scores, from group vector sums (centroid_confidence)
+        instead of similarity blocks, for components mode (no dense similarity matrix).
+        Rescored pairs in the same group add (blended − cosine) to both members' sums, as their
+        blended scores replace cosine in the dense matrix.
+    """
+    from sklearn.preprocessing import normalize
+    from scipy.sparse import csr_matrix
+    _, group_codes = np.unique(group_keys(grouped), return_inverse=True)
+    group_codes = group_codes.ravel()
+    text_ids = grouped['text_id'].to_numpy()
+    normalized = normalize(id_matrix.tocsr())
+    confidence_scores = centroid_confidence(normalized, text_ids, group_codes)
+
+    if rescored is not None and rescored.nnz:
+        pairs = rescored.tocoo()
+        cosine = np.asarray(normalized[pairs.row].multiply(normalized[pairs.col]).sum(axis=1)).ravel()
+        n_texts = normalized.shape[0]
+        deltas = csr_matrix((np.r_[pairs.data - cosine, pairs.data - cosine],
+                             (np.r_[pairs.row, pairs.col], np.r_[pairs.col, pairs.row])), shape=(n_texts, n_texts))
+        # rows with text t in group g: deltas[t] · (rows of each text in g)
+        members = csr_matrix((np.ones(len(grouped)), (group_codes, text_ids)),
+                             shape=(int(group_codes.max()) + 1, n_texts))
+        row_deltas = group_text_dots(deltas, members, group_codes, text_ids)
+        sizes = np.bincount(group_codes)[group_codes]
+        confidence_scores = confidence_scores + np.where(sizes > 1, row_deltas / np.maximum(sizes - 1, 1), 0)
+
+    grouped['Confidence'] = np.round(confidence_scores * 100, 1)
+    return grouped
 
-        # Calculate average similarity to other members of the group
-        sims = [
-            similarity[idx, other_idx]
-            for other_idx in members
-            if other_idx != idx
-        ]
-        confidence = sum(sims) / len(sims)
-        confidence_scores.append(confidence)
 
-    grouped['Confidence'] = [round(c * 100, 1) for c in confidence_scores]
+def assign_representatives(grouped, id_matrix):
+    """
+        Mark each group's medoid, the member closest to the group's TF-IDF centroid: the highest
+        cosine with the sum of its members' normalized vectors (ties go to the earliest row).
+        Adds Representative_Locality (the medoid's locality, on every member) and Is_Representative.
+        O(nnz) via group_sum_dots, no similarity blocks, so large groups stay cheap.
+    """
+    from sklearn.preprocessing import normalize
+    _, group_codes = np.unique(group_keys(grouped), return_inverse=True)
+    group_codes = group_codes.ravel()
+    pair_groups, _, pair_of_row, dots = group_sum_dots(
+        normalize(id_matrix.tocsr()), grouped['text_id'].to_numpy(), group_codes)
+
+    # earliest row of each (group, text) pair; rounding keeps float noise from breaking ties
+    rows = np.arange(len(grouped))
+    first_row = np.full(len(dots), len(grouped))
+    np.minimum.at(first_row, pair_of_row, rows)
+    order = np.lexsort((first_row, -np.round(dots, 12), pair_groups))
+    leaders = order[np.r_[True, pair_groups[order][1:] != pair_groups[order][:-1]]] if len(order) else order
+    representative_rows = first_row[leaders]
+
+    grouped['Representative_Locality'] = grouped['locality'].to_numpy()[representative_rows][group_codes]
+    is_representative = np.zeros(len(grouped), dtype=bool)
+    is_representative[representative_rows] = True
+    grouped['Is_Representative'] = is_representative
     return grouped
 
 
@@ -748,29 +1725,41 @@ def validate_directional_splits(grouped):
     """
     Split groups with the same Suggested_ID into subgroups by distinct distance/direction signatures.
     Validate suggested groups by distance/direction.
+    Subgroups are numbered .1, .2, ... in order of each signature's first appearance in the group.
     """
-    for group_id in grouped['Suggested_ID'].unique():
-        members = grouped[grouped['Suggested_ID'] == group_id]
-        # get the list of extracted distance/direction for each member
-        distance_lists = members['distance_direction']
-
-        # if all members either have no distance/direction or all have the exact same, do not split
-        if len(distance_lists.apply(tuple).unique()) <= 1:
-            continue
-
-        # if no members have any distance/direction data, do not split
-        signatures = distance_lists.apply(tuple).unique()
-        if all(len(lst) == 0 for lst in distance_lists):
-            continue
-        for idx, sig in enumerate(signatures, start=1):  # start=1 to begin with .1
-            suffix = f".{idx}"
-            to_update = members[distance_lists.apply(tuple) == sig].index
-            grouped.loc[to_update, 'Grouper_ID'] = f"{group_id}{suffix}"
+    base = grouped['Suggested_ID'].to_numpy(np.int64)
+    sig = grouped['dd_signature'].to_numpy(np.int64)
+    n = len(grouped)
+    if n == 0:
+        grouped['Group_Sub'] = np.zeros(0, dtype=np.int32)
         return grouped
 
+    # distinct (group, signature) pairs; a stable sort keeps each pair's first row at the front of its run
+    order = np.lexsort((sig, base))
+    new_pair = np.r_[True, (base[order][1:] != base[order][:-1]) | (sig[order][1:] != sig[order][:-1])]
+    pair_of_row = np.empty(n, dtype=np.int64)
+    pair_of_row[order] = np.cumsum(new_pair) - 1
+    pair_first_row = order[new_pair]
+    pair_base = base[pair_first_row]
+
+    # number signatures by first appearance within each group
+    by_appearance = np.lexsort((pair_first_row, pair_base))
+    sorted_base = pair_base[by_appearance]
+    run_start = np.r_[True, sorted_base[1:] != sorted_base[:-1]]
+    run_id = np.cumsum(run_start) - 1
+    rank = np.arange(len(by_appearance)) - np.flatnonzero(run_start)[run_id]
+    n_signatures = np.bincount(run_id)[run_id]
+
+    # if all members have the exact same signature (including all empty), do not split
+    pair_sub = np.empty(len(by_appearance), dtype=np.int32)
+    pair_sub[by_appearance] = np.where(n_signatures > 1, rank + 1, 0)
+
+    grouped['Group_Sub'] = pair_sub[pair_of_row]
+    return grouped
 
-def set_null_groups_to_zero(grouped):
-    """If the original locality is blank, null, or matches known placeholders, set Grouper_ID to 0"""
+
+def null_locality_mask(grouped):
+    """True where the original locality is blank, null, or matches known placeholders"""
     null_strings = [
         'unknown',
         'no locality',
@@ -787,174 +1776,1356 @@ def set_null_groups_to_zero(grouped):
         'no location'
     ]
 
-    mask = (
+    return (
         grouped['locality'].isnull()
         | (grouped['locality'].str.strip() == '')
         | (grouped['locality'].str.strip().str.lower().isin({s.lower() for s in null_strings}))
     )
 
-    grouped.loc[mask, 'Grouper_ID'] = '0'
+
+def set_null_groups_to_zero(grouped):
+    """If the original locality is blank, null, or matches known placeholders, set the group to 0"""
+    mask = null_locality_mask(grouped)
+
+    grouped.loc[mask, 'Group_Base'] = 0
+    grouped.loc[mask, 'Group_Sub'] = 0
 
     return grouped
 
 
-def reorder_similar_singletons(grouped, similarity, min_similarity=0.80):
+def reorder_similar_singletons(grouped, similarity, min_similarity=0.80, chunk_size=1024):
     """
     Reorder singletons based on similarity to closest larger group.
     Identify singleton groups and place them after the most similar non-singleton group.
+    `similarity` is the dense matrix, or a sparse neighbor graph holding every pair ≥ min_similarity
+    (components mode), in which case only the singletons' edges are read.
+    Returns {singleton group key: anchor group key} using the int64 keys from group_keys().
     """
+    from scipy.sparse import csr_matrix, issparse
     start_time = time.time()
     print("Identifying singleton placements...")
 
-    group_id_to_indices = defaultdict(list)
-    for idx, gid in enumerate(grouped['Grouper_ID']):
-        group_id_to_indices[gid].append(idx)
+    keys = group_keys(grouped)
+    # groups numbered in order of first appearance, so ties go to the earliest group
+    uniq_keys, first_rows, group_codes, sizes = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+    appearance = np.argsort(first_rows, kind='stable')
+    rank = np.empty_like(appearance)
+    rank[appearance] = np.arange(len(appearance))
+    group_codes = rank[group_codes]
+    uniq_keys = uniq_keys[appearance]
+    sizes = sizes[appearance]
 
-    # Count how many rows belong to each base group (before .01, .02 suffixes)
-    base_group_counts = grouped['Grouper_ID'].apply(lambda x: str(x).split('.')[0]).value_counts().to_dict()
+    # Count how many rows belong to each base group (before .1, .2 suffixes)
+    bases = grouped['Group_Base'].to_numpy()
+    base_counts = np.bincount(bases)
+    uniq_bases = (uniq_keys >> 32).astype(np.int64)
+    uniq_subs = (uniq_keys & 0xFFFFFFFF).astype(np.int64)
 
-    # Filter singleton_ids (that are not directionally split)
-    singleton_ids = []
-    for gid, idxs in group_id_to_indices.items():
-        if len(idxs) != 1:
-            continue  # Not a singleton
+    # Filter singleton groups (that are not directionally split)
+    is_singleton = (sizes == 1) & ~((uniq_subs > 0) & (base_counts[uniq_bases] > 1))
 
-        match = re.match(r'^(\d+)\.\d+$', str(gid))
-        if match:
-            base_id = match.group(1)
-            if base_group_counts.get(base_id, 0) > 1:
-                continue  # It's a directional split — skip it
+    singleton_groups = np.flatnonzero(is_singleton)
+    non_singleton_groups = np.flatnonzero(~is_singleton)
 
-        singleton_ids.append(gid)
+    singleton_inserts = {}
+    if len(singleton_groups) and len(non_singleton_groups):
+        # columns of every non-singleton member, sorted by group so np.maximum.reduceat gives per-group max
+        member_mask = ~is_singleton[group_codes]
+        member_rows = np.flatnonzero(member_mask)
+        member_rows = member_rows[np.argsort(group_codes[member_rows], kind='stable')]
+        member_groups = group_codes[member_rows]
+        starts = np.flatnonzero(np.r_[True, member_groups[1:] != member_groups[:-1]])
+        target_groups = member_groups[starts]
+
+        text_ids = grouped['text_id'].to_numpy()
+        member_texts = text_ids[member_rows]
+        singleton_rows = np.flatnonzero(is_singleton[group_codes])
+        if issparse(similarity):
+            # (singleton row, group, edge weight) for every edge from a singleton's text to a member's text
+            text_groups = csr_matrix((np.ones(len(member_rows)), (member_texts, member_groups)),
+                                     shape=(similarity.shape[0], len(uniq_keys)))
+            edges = similarity.tocsr()[text_ids[singleton_rows]].tocoo()
+            keep = edges.data >= min_similarity
+            edge_rows, edge_texts, weights = edges.row[keep], edges.col[keep], edges.data[keep]
+            counts = np.diff(text_groups.indptr)[edge_texts]
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            pair_groups = text_groups.indices[np.repeat(text_groups.indptr[edge_texts], counts) + offsets]
+            pair_rows, pair_weights = np.repeat(edge_rows, counts), np.repeat(weights, counts)
+            # best weight per singleton, ties → the earliest group (as argmax on the dense rows)
+            order = np.lexsort((pair_groups, -pair_weights, pair_rows))
+            first = order[np.r_[True, pair_rows[order][1:] != pair_rows[order][:-1]]] if len(order) else order
+            for row, b in zip(singleton_rows[pair_rows[first]], pair_groups[first]):
+                singleton_inserts[int(keys[row])] = int(uniq_keys[b])
+        else:
+            for c in range(0, len(singleton_rows), chunk_size):
+                rows = singleton_rows[c:c + chunk_size]
+                sims = np.asarray(similarity[text_ids[rows]][:, member_texts])
+                group_max = np.maximum.reduceat(sims, starts, axis=1)
+                best = group_max.argmax(axis=1)
+                best_score = group_max[np.arange(len(rows)), best]
+                for row, b, score in zip(rows, best, best_score):
+                    if score >= min_similarity:
+                        singleton_inserts[int(keys[row])] = int(uniq_keys[target_groups[b]])
+
+    print(f"Placed {len(singleton_inserts)} of {len(singleton_groups)} singleton groups based on similarity ≥ {min_similarity}.")
+    print(f"Completed in {time.time() - start_time:.2f} seconds.")
 
-    # Now define non-singleton_ids AFTER filtering valid singleton_ids
-    non_singleton_ids = [gid for gid in group_id_to_indices if gid not in singleton_ids]
+    return singleton_inserts
 
-    singleton_inserts = {}
-    for singleton_id in singleton_ids:
-        singleton_idx = group_id_to_indices[singleton_id][0]
-        best_score = -1
-        best_match_id = None
+def assign_sort_keys(grouped, singleton_inserts):
+    """
+    Precompute integer export sort columns once, vectorized:
+        Sort_Base, Sort_Suffix (-1 for a base group, so it sorts first), Sort_Offset.
+    Placed singletons take their anchor group's (base, suffix) with Sort_Offset = 1,
+    so they land directly after the anchor.
+    """
+    own = group_keys(grouped)
+    anchor = pd.Series(own).map(singleton_inserts)
+    placed = anchor.notna().to_numpy()
+    sort_keys = np.where(placed, anchor.fillna(0).to_numpy(np.int64), own)
+
+    def split(k):
+        sub = k & 0xFFFFFFFF
+        return k >> 32, np.where(sub == 0, -1, sub)
+
+    grouped['Sort_Base'], grouped['Sort_Suffix'] = split(sort_keys)
+    grouped['Sort_Offset'] = placed.astype(np.int8)
+    # own key breaks ties between several singletons placed on the same anchor
+    grouped['Sort_Own_Base'], grouped['Sort_Own_Suffix'] = split(own)
+    return grouped
 
-        for gid in non_singleton_ids:
-            group_idxs = group_id_to_indices[gid]
-            max_sim = max(similarity[singleton_idx, other_idx] for other_idx in group_idxs)
 
-            if max_sim > best_score:
-                best_score = max_sim
-                best_match_id = gid
+def sort_by_group_keys(frame, grouped):
+    """Order rows of `frame` (indexed like `grouped`) with a single stable lexsort over the sort columns."""
+    keys = grouped.loc[frame.index, ['Sort_Own_Suffix', 'Sort_Own_Base', 'Sort_Offset', 'Sort_Suffix', 'Sort_Base']]
+    order = np.lexsort([keys[col].to_numpy() for col in keys.columns])
+    return frame.iloc[order]
 
-        if best_score >= min_similarity:
-            singleton_inserts[singleton_id] = best_match_id
 
-    print(f"Placed {len(singleton_inserts)} of {len(singleton_ids)} singleton groups based on similarity ≥ {min_similarity}.")
-    print(f"Completed in {time.time() - start_time:.2f} seconds.")
+def require_pyarrow(output_format):
+    """Exit early (before any heavy work) when a columnar output format is asked for without pyarrow."""
+    if output_format == 'csv':
+        return
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print(f"--output-format {output_format} requires pyarrow (pip install pyarrow).")
+        sys.exit(1)
 
-    return singleton_inserts
 
-def sort_key(val):
+def write_table(frame, path_base, output_format, dictionary_columns=(), list_columns=None):
     """
-    Sort key for Grouper_ID values supporting numeric and sub-suffix (e.g., '12.1').
+    Write a frame as <path_base>.csv|.parquet|.feather.
+    For the columnar formats, `dictionary_columns` are dictionary-encoded and
+    `list_columns` maps column name → ready-built Arrow array.
     """
-    match = re.match(r'^(\d+)(?:\.(\d+))?$', str(val))
-    if match:
-        num = int(match.group(1))
-        suffix = int(match.group(2)) if match.group(2) else -1  # -1 puts base group first
-        return (num, suffix)
+    if output_format == 'csv':
+        output_file = path_base + '.csv'
+        frame.to_csv(output_file, index=False, encoding='utf-8-sig')
+        return output_file
+
+    import pyarrow as pa
+
+    frame = frame.copy()
+    for col in frame.columns:
+        if col in dictionary_columns:
+            frame[col] = frame[col].astype('string').astype('category')
+        elif frame[col].dtype == object:
+            # mixed int/str passthrough columns can't be typed by Arrow as-is
+            frame[col] = frame[col].astype('string')
+
+    list_columns = list_columns or {}
+    table = pa.Table.from_pandas(frame.drop(columns=list(list_columns)), preserve_index=False)
+    for name, array in list_columns.items():
+        table = table.add_column(list(frame.columns).index(name), name, array)
+
+    if output_format == 'parquet':
+        import pyarrow.parquet as pq
+        output_file = path_base + '.parquet'
+        pq.write_table(table, output_file)
     else:
-        return (float('inf'), float('inf'))
+        import pyarrow.feather as feather
+        output_file = path_base + '.feather'
+        feather.write_feather(table, output_file)
+    return output_file
 
 
-def grouper_sort_key(gid, singleton_inserts):
-    """
-    Sort key that places singleton IDs directly after their closest matched group ID.
-    """
-    if gid in singleton_inserts:
-        anchor_gid = singleton_inserts[gid]
-        anchor_tuple = sort_key(anchor_gid)
-        singleton_weight = 0.5  # Ensure it's placed *after* the anchor
-        return (anchor_tuple[0], anchor_tuple[1] + singleton_weight)
-    else:
-        return sort_key(gid)
+KEY_DICTIONARY_COLUMNS = ('Grouper_ID', 'institutionCode', 'collectionCode', 'county')
 
-def export_grouped_csv(grouped, df, csv_path, grouping_field, singleton_inserts):
 
-    # --- Convert extracted distance_direction tuples to readable string ---
-    grouped['Distance_Direction'] = grouped['distance_direction'].apply(
-        lambda lst: '; '.join([f"{d} {u} {dir}" if u else f"{d} {dir}" for d, dir, u in lst]) if lst else ''
-    )
+def build_key_table(grouped, directions, output_format='csv'):
+    """
+    The -key table: one row per record with Grouper_ID, normalized_locality, Confidence and
+    Distance_Direction (readable strings for csv, the signature hash otherwise), in group order.
+    """
+    # --- Render the integer group columns as Grouper_ID strings ---
+    grouped['Grouper_ID'] = format_grouper_ids(grouped)
 
     # --- Export ---
     columns_to_export = [
         'catalogNumber', 'institutionCode', 'collectionCode', 'county',
         'locality', 'bels_location_id', 'Grouper_ID', 'normalized_locality', 'Confidence',
-        'Distance_Direction'
+        'Representative_Locality', 'Is_Representative', *PRIOR_COLUMNS, 'Distance_Direction'
     ]
 
-    export_df = grouped[columns_to_export].drop_duplicates()
-
-    # --- Merge back ---
-    output_df = df.merge(
-        grouped[[grouping_field, 'Grouper_ID', 'normalized_locality']],
-        on=grouping_field,
-        how='left'
-    )
-
+    # --- Decode distance/direction records: readable string for CSV, signature hash as a stand-in otherwise ---
+    if output_format == 'csv':
+        grouped['Distance_Direction'] = directions.to_strings()
+    else:
+        grouped['Distance_Direction'] = grouped['dd_signature']
 
     # For consistent columns, protect against missing
     columns_to_export = [col for col in columns_to_export if col in grouped.columns]
 
+    export_df = grouped[columns_to_export].drop_duplicates()
 
-    export_df = export_df.sort_values(
-        by='Grouper_ID',
-        key=lambda col: col.map(lambda gid: grouper_sort_key(gid, singleton_inserts))
-    )
+    return sort_by_group_keys(export_df, grouped)
 
 
-    output_file = os.path.splitext(csv_path)[0] + '-key.csv'
-    export_df.to_csv(output_file, index=False, encoding='utf-8-sig')
+def export_grouped_csv(grouped, directions, df, csv_path, grouping_field,
+                       output_format='csv', write_merged=False):
+    """Write the -key table (and with write_merged the full input with Grouper_ID); returns the key file path"""
+    export_df = build_key_table(grouped, directions, output_format)
+
+    path_base = os.path.splitext(csv_path)[0]
+    list_columns = None
+    if output_format != 'csv':
+        list_columns = {'Distance_Direction': directions.to_arrow(export_df.index.to_numpy())}
+
+    output_file = write_table(export_df, path_base + '-key', output_format, KEY_DICTIONARY_COLUMNS, list_columns)
     print(f"Exported with suggested groups to: {output_file}")
 
-def grouper_main():
-    """master function which runs all methods above in the necessary order"""
-    grouping_field = "bels_location_id"
+    if write_merged:
+        # --- Merge back (replacing any Grouper_ID already in the input, e.g. BelsFillet's blank one) ---
+        output_df = df.drop(columns=['Grouper_ID', 'normalized_locality'], errors='ignore').merge(
+            grouped[[grouping_field, 'Grouper_ID', 'normalized_locality']],
+            on=grouping_field,
+            how='left'
+        )
+        merged_file = write_table(output_df, path_base + '-grouped', output_format, KEY_DICTIONARY_COLUMNS)
+        print(f"Exported merged input with Grouper_ID to: {merged_file}")
 
-    # 1) read in input csv
-    df, sep, csv_path = load_input_csv(grouping_field)
+    return output_file
+
+
+def group_text_dots(normalized, sums, pair_groups, pair_texts):
+    """
+    Dot product of text vector normalized[t] with group vector sums[g] for every (g, t) pair,
+    in O(nnz) lookups: each nonzero of a pair's text is looked up in the sorted (group, column) keys of `sums`.
+    """
+    n_cols = normalized.shape[1]
+    texts = normalized[pair_texts]
+    owner = np.repeat(np.arange(len(pair_texts)), np.diff(texts.indptr))
+    query = pair_groups[owner].astype(np.int64) * n_cols + texts.indices
+
+    sums = sums.tocsr()
+    sums.sort_indices()
+    keys = np.repeat(np.arange(sums.shape[0], dtype=np.int64), np.diff(sums.indptr)) * n_cols + sums.indices
+    pos = np.minimum(np.searchsorted(keys, query), max(len(keys) - 1, 0))
+    hit = keys[pos] == query if len(keys) else np.zeros(len(query), dtype=bool)
+    values = texts.data * np.where(hit, sums.data[pos] if len(keys) else 0, 0)
+    return np.bincount(owner, weights=values, minlength=len(pair_texts))
+
+
+def group_sum_dots(normalized, text_ids, group_codes):
+    """
+    For every distinct (group, text) pair of the rows: x · (sum of the group's row vectors), with
+    the sums from one sparse group-indicator × text-matrix product (rows sharing a text count once each).
+    Returns (pair_groups, pair_texts, pair_of_row, dots).
+    """
+    from scipy.sparse import csr_matrix
+    n_texts = normalized.shape[0]
+    pair_keys, pair_of_row, pair_counts = np.unique(
+        group_codes.astype(np.int64) * n_texts + text_ids, return_inverse=True, return_counts=True)
+    pair_groups = pair_keys // n_texts
+    pair_texts = pair_keys % n_texts
+
+    indicator = csr_matrix((pair_counts.astype(np.float64), (pair_groups, pair_texts)),
+                           shape=(int(group_codes.max()) + 1 if len(group_codes) else 0, n_texts))
+    sums = indicator @ normalized
+    dots = group_text_dots(normalized, sums, pair_groups, pair_texts)
+    return pair_groups, pair_texts, pair_of_row.ravel(), dots
+
+
+def centroid_confidence(normalized, text_ids, group_codes):
+    """
+    Exact average intra-group cosine similarity per row without a similarity matrix:
+        (x · sum of the group's vectors − x · x) / (group size − 1), 1.0 for one-member groups.
+    `normalized` holds L2-normalized unique-text vectors, `text_ids` maps rows to them.
+    """
+    pair_groups, pair_texts, pair_of_row, dots = group_sum_dots(normalized, text_ids, group_codes)
+    self_dots = np.asarray(normalized.multiply(normalized).sum(axis=1)).ravel()[pair_texts]
+
+    sizes = np.bincount(group_codes)[pair_groups]
+    pair_conf = np.where(sizes > 1, (dots - self_dots) / np.maximum(sizes - 1, 1), 1.0)
+    return pair_conf[pair_of_row]
+
+
+def parse_sweep(spec):
+    """'0.75:0.95:0.01' → array of thresholds (inclusive of the end value)"""
+    try:
+        low, high, step = (float(x) for x in spec.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected START:STOP:STEP, e.g. 0.75:0.95:0.01")
+    if not (0 < low <= high <= 1) or step <= 0:
+        raise argparse.ArgumentTypeError("thresholds must satisfy 0 < START ≤ STOP ≤ 1 and STEP > 0")
+    return np.round(np.arange(low, high + step / 2, step), 6)
+
+
+def parse_band(spec):
+    """'0.70:0.90' → (0.70, 0.90)"""
+    try:
+        low, high = (float(x) for x in spec.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected LOW:HIGH, e.g. 0.70:0.90")
+    if not 0 < low < high <= 1:
+        raise argparse.ArgumentTypeError("band must satisfy 0 < LOW < HIGH ≤ 1")
+    return low, high
+
+
+def threshold_sweep(grouped, id_matrix, thresholds, method='greedy', max_diameter=None, min_similarity=0.80,
+                    rescored=None):
+    """
+    Derive groupings and their statistics for every threshold from one neighbor graph,
+    built once at the lowest threshold with edge weights kept. Directional splits, null
+    groups and confidence (exact, via group vector sums) are applied as in a normal run.
+    With rescored pairs, their blended scores replace cosine in the graph; confidence stays cosine.
+    Returns one report row per threshold.
+    """
+    from sklearn.preprocessing import normalize
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import connected_components
+    start_time = time.time()
+    graph = build_scoring_graph(id_matrix, min(thresholds.min(), min_similarity), rescored).tocoo()
+    normalized = normalize(id_matrix.tocsr())
+    n_texts = id_matrix.shape[0]
+    text_ids = grouped['text_id'].to_numpy()
+    text_keys = np.empty(n_texts, dtype=object)
+    text_keys[text_ids] = grouped['normalized_locality'].to_numpy()
+    null_mask = null_locality_mask(grouped).to_numpy()
+    print(f"Built neighbor graph at similarity ≥ {min(thresholds.min(), min_similarity):.2f} "
+          f"with {graph.nnz // 2:,} edges in {time.time() - start_time:.2f} seconds.")
+
+    def graph_at(threshold):
+        keep = graph.data >= threshold
+        return csr_matrix((graph.data[keep], (graph.row[keep], graph.col[keep])), shape=(n_texts, n_texts))
+
+    placement_graph = graph_at(min_similarity)
+    report = []
+    for threshold in thresholds:
+        graph_t = graph_at(threshold)
+        if method == 'components' and not max_diameter:
+            _, labels = connected_components(graph_t, directed=False)
+        elif method == 'components':
+            labels = carve_groups(graph_t, max(1, max_diameter // 2), carving_order(graph_t, text_keys))
+        else:
+            # greedy grouping is exactly one-hop carving in row order
+            labels = carve_groups(graph_t, 1)
+
+        frame = pd.DataFrame({'Suggested_ID': labels[text_ids] + 1, 'dd_signature': grouped['dd_signature'].to_numpy()})
+        frame = validate_directional_splits(frame)
+        frame['Group_Base'] = np.where(null_mask, 0, frame['Suggested_ID']).astype(np.int32)
+        frame.loc[null_mask, 'Group_Sub'] = 0
+        _, codes = np.unique(group_keys(frame), return_inverse=True)
+        codes = codes.ravel()
+        sizes = np.bincount(codes)
+        row_sizes = sizes[codes]
+
+        confidence = centroid_confidence(normalized, text_ids, codes) * 100
+        multi = row_sizes > 1
+        multi_conf = confidence[multi]
+
+        # singletons (not directional splits) that would be placed after a non-singleton group
+        base_counts = np.bincount(frame['Group_Base'].to_numpy())[frame['Group_Base'].to_numpy()]
+        singleton = (row_sizes == 1) & ~((frame['Group_Sub'].to_numpy() > 0) & (base_counts > 1))
+        text_in_group = np.zeros(n_texts)
+        np.maximum.at(text_in_group, text_ids[~singleton], 1.0)
+        placeable = (placement_graph @ text_in_group)[text_ids] > 0
+
+        report.append({
+            'threshold': threshold,
+            'edges': graph_t.nnz // 2,
+            'groups': len(sizes),
+            'multi_member_groups': int((sizes > 1).sum()),
+            'singleton_groups': int(singleton.sum()),
+            'placed_singletons': int((singleton & placeable).sum()),
+            'largest_group': int(sizes.max()) if len(sizes) else 0,
+            'rows_in_multi_member_groups': int(multi.sum()),
+            'mean_confidence': round(float(multi_conf.mean()), 1) if len(multi_conf) else None,
+            'median_confidence': round(float(np.median(multi_conf)), 1) if len(multi_conf) else None,
+            'p10_confidence': round(float(np.percentile(multi_conf, 10)), 1) if len(multi_conf) else None,
+        })
+
+    print(f"Swept {len(thresholds)} thresholds in {time.time() - start_time:.2f} seconds.")
+    return pd.DataFrame(report)
+
+
+# --- Checkpoints ---
+
+CHECKPOINT_STAGES = ('preprocess', 'aliases', 'tfidf', 'groups')
+
+# approximate size of the stage results the job server keeps in memory (see WarmCheckpoints)
+WARM_CHECKPOINT_BYTES = 2 << 30
+
+
+def use_checkpoints(options):
+    return options.checkpoint or options.resume
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def checkpoint_settings(args, alias_map=None):
+    """
+    Settings each stage's output depends on (later stages also depend on everything before them).
+    A shared alias map (batch mode) is part of the aliases stage's settings.
+    """
+    settings = {
+        'tfidf': {
+            'features': args.features,
+            'n_features': args.n_features if args.features == 'hashing' else None,
+            'dedup': not args.no_dedup,
+        },
+        'groups': {
+            'threshold': args.threshold,
+            'grouping': args.grouping,
+            'max_diameter': args.max_diameter,
+            'similarity_dtype': np.dtype(args.similarity_dtype).name,
+            'rescore': args.rescore,
+            'rescore_weight': args.rescore_weight,
+            'rescore_cutoff': args.rescore_cutoff,
+        },
+    }
+    if alias_map is not None:
+        encoded = json.dumps(alias_map, sort_keys=True).encode()
+        settings['aliases'] = {'shared': hashlib.sha256(encoded).hexdigest()[:16]}
+    if args.alias_map:
+        settings.setdefault('aliases', {})['seed'] = file_sha256(args.alias_map)
+    return settings
+
+
+def write_frame(f, frame):
+    """
+    A DataFrame as one .npz without pickles: numeric, bool and datetime columns as arrays, every other
+    column as a JSON list of its values (str, int, float/NaN and None keep their types), plus the column
+    names and dtypes. The index is not kept (checkpointed frames have a default RangeIndex).
+    """
+    arrays, dtypes = {}, []
+    for i, column in enumerate(frame.columns):
+        values = frame.iloc[:, i]
+        dtypes.append(str(values.dtype))
+        if values.dtype.kind in 'biufcmM':
+            arrays[f"c{i}"] = values.to_numpy()
+        else:
+            encoded = json.dumps(values.astype(object).tolist(),
+                                 default=lambda v: v.item() if hasattr(v, 'item') else str(v))
+            arrays[f"j{i}"] = np.frombuffer(encoded.encode('utf-8'), dtype=np.uint8)
+    meta = {'columns': list(frame.columns), 'dtypes': dtypes, 'length': len(frame)}
+    arrays['meta'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+    np.savez(f, **arrays)
+
+
+def read_frame(path):
+    """The DataFrame saved by write_frame (never unpickles anything)."""
+    with np.load(path, allow_pickle=False) as arrays:
+        meta = json.loads(arrays['meta'].tobytes().decode('utf-8'))
+        columns = {}
+        for i, dtype in enumerate(meta['dtypes']):
+            if f"c{i}" in arrays:
+                columns[i] = arrays[f"c{i}"]
+            else:
+                values = pd.Series(json.loads(arrays[f"j{i}"].tobytes().decode('utf-8')), dtype=object)
+                columns[i] = values if dtype == 'object' else values.astype(dtype)
+    frame = pd.DataFrame(columns, index=pd.RangeIndex(meta['length']))
+    frame.columns = meta['columns']
+    return frame
+
+
+class Checkpoints:
+    """
+    Stage checkpoints in <input>-checkpoints/, keyed by the input file's SHA-256 plus the settings
+    of the stage and every stage before it, so a changed file or setting never resumes stale data.
+    Parts are written to a temporary file and renamed, and each stage's manifest is written last:
+    a stage is valid only when its manifest and all of its parts are present and load. Saving a
+    stage removes its checkpoints for other keys, so the folder holds one set at most.
+        DataFrame → .npz (see write_frame), sparse matrix → .npz, DistanceDirections → .npz, dict → .json
+    Nothing is pickled, so loading a checkpoint can't run code.
+    """
+
+    def __init__(self, csv_path, settings):
+        self.folder = os.path.splitext(csv_path)[0] + '-checkpoints'
+        self.location = self.folder
+        cumulative = {'input': file_sha256(csv_path)}
+        self.keys = {}
+        for stage in CHECKPOINT_STAGES:
+            cumulative[stage] = settings.get(stage, {})
+            encoded = json.dumps(cumulative, sort_keys=True, default=str).encode()
+            self.keys[stage] = hashlib.sha256(encoded).hexdigest()[:16]
+
+    def _path(self, stage, name):
+        return os.path.join(self.folder, f"{stage}-{self.keys[stage]}.{name}")
+
+    def _write(self, path, write, mode='wb'):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, mode) as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def save(self, stage, **parts):
+        """Write one stage's parts (None values are skipped), then its manifest."""
+        from scipy.sparse import save_npz
+        start_time = time.time()
+        os.makedirs(self.folder, exist_ok=True)
+        manifest = {}
+        for name, value in parts.items():
+            if value is None:
+                continue
+            if isinstance(value, pd.DataFrame):
+                kind, file_name = 'table', f"{name}.npz"
+                self._write(self._path(stage, file_name), lambda f: write_frame(f, value))
+            elif isinstance(value, DistanceDirections):
+                kind, file_name = 'directions', f"{name}.npz"
+                self._write(self._path(stage, file_name), lambda f: np.savez(
+                    f, offsets=value.offsets, distance=value.distance, direction=value.direction, unit=value.unit))
+            elif isinstance(value, dict):
+                kind, file_name = 'json', f"{name}.json"
+                self._write(self._path(stage, file_name), lambda f: json.dump(value, f), mode='w')
+            else:
+                kind, file_name = 'sparse', f"{name}.npz"
+                self._write(self._path(stage, file_name), lambda f: save_npz(f, value.tocsr()))
+            manifest[name] = [kind, file_name]
+        self._write(self._path(stage, 'manifest.json'), lambda f: json.dump(manifest, f), mode='w')
+        self._prune(stage, {file_name for _, file_name in manifest.values()} | {'manifest.json'})
+        print(f"Saved '{stage}' checkpoint in {time.time() - start_time:.2f} seconds.")
+
+    def _prune(self, stage, kept):
+        """Remove the stage's files for other keys (and leftovers not in its manifest)."""
+        kept = {os.path.basename(self._path(stage, name)) for name in kept}
+        for file_name in os.listdir(self.folder):
+            if file_name.startswith(f"{stage}-") and file_name not in kept:
+                try:
+                    os.remove(os.path.join(self.folder, file_name))
+                except OSError:
+                    pass
+
+    def load(self, stage):
+        """One stage's parts as {name: value}, or None when missing or unreadable."""
+        from scipy.sparse import load_npz
+        try:
+            with open(self._path(stage, 'manifest.json')) as f:
+                manifest = json.load(f)
+            parts = {}
+            for name, (kind, file_name) in manifest.items():
+                path = self._path(stage, file_name)
+                if kind == 'table':
+                    parts[name] = read_frame(path)
+                elif kind == 'directions':
+                    with np.load(path) as arrays:
+                        parts[name] = DistanceDirections(arrays['offsets'], arrays['distance'],
+                                                         arrays['direction'], arrays['unit'])
+                elif kind == 'json':
+                    with open(path) as f:
+                        parts[name] = json.load(f)
+                elif kind == 'sparse':
+                    parts[name] = load_npz(path).tocsr()
+                else:
+                    return None
+            return parts
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            return None
+
+    def latest(self):
+        """
+        The last stage whose checkpoint and all earlier ones are valid, with their parts merged
+        (later stages override same-named parts). Returns (None, {}) when there is none.
+        """
+        found, parts = None, {}
+        for stage in CHECKPOINT_STAGES:
+            stage_parts = self.load(stage)
+            if stage_parts is None:
+                break
+            found = stage
+            parts.update(stage_parts)
+        return found, parts
+
+
+class WarmCheckpoints(Checkpoints):
+    """
+    Checkpoints kept in memory by the job server instead of on disk, with the same keys.
+    store is shared between jobs: it maps each key to (parts, approximate bytes), and the least
+    recently used entries are dropped once the total passes max_bytes (the newest entry is always
+    kept). Parts are copied in and out because later stages modify frames in place.
+    """
+
+    def __init__(self, csv_path, settings, store, max_bytes=WARM_CHECKPOINT_BYTES):
+        super().__init__(csv_path, settings)
+        self.store = store
+        self.max_bytes = max_bytes
+        self.location = 'memory'
+
+    def save(self, stage, **parts):
+        key = (stage, self.keys[stage])
+        parts = {name: copy_part(value) for name, value in parts.items() if value is not None}
+        self.store[key] = (parts, sum(part_nbytes(value) for value in parts.values()))
+        self.store.move_to_end(key)
+        total = sum(nbytes for _, nbytes in self.store.values())
+        while total > self.max_bytes and len(self.store) > 1:
+            _, (_, nbytes) = self.store.popitem(last=False)
+            total -= nbytes
+
+    def load(self, stage):
+        key = (stage, self.keys[stage])
+        if key not in self.store:
+            return None
+        self.store.move_to_end(key)
+        parts, _ = self.store[key]
+        return {name: copy_part(value) for name, value in parts.items()}
+
+
+def copy_part(value):
+    """Copy of a checkpoint part (DistanceDirections is never modified, so it is shared)."""
+    return value if isinstance(value, DistanceDirections) else value.copy()
+
+
+def part_nbytes(value):
+    """Approximate memory of a checkpoint part: frames with their strings, arrays, sparse matrices, dicts."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, DistanceDirections):
+        return sum(array.nbytes for array in (value.offsets, value.distance, value.direction, value.unit))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    arrays = [getattr(value, name) for name in ('data', 'indices', 'indptr', 'row', 'col') if hasattr(value, name)]
+    return sum(array.nbytes for array in arrays) if arrays else int(getattr(value, 'nbytes', 0))
+
+
+# --- Historical georeference index ---
+
+# Reviewed coordinates in the "From CoGe" sheet (see fillCoGeFormulas in SpreadsheetTools.gs)
+FROM_COGE_COLUMNS = {
+    'grouper_id': 'Grouper_ID',
+    'latitude': 'Corrected latitude',
+    'longitude': 'Corrected longitude',
+    'uncertainty_m': 'Corrected uncertainty radius',
+    'verified': 'Date verified',
+}
+
+PRIOR_COLUMNS = ['Prior_Locality', 'Prior_Latitude', 'Prior_Longitude', 'Prior_Uncertainty',
+                 'Prior_Similarity', 'Prior_Candidates']
+
+
+class LocalityIndex:
+    """
+    Finalized normalized localities with their reviewed coordinates, kept in a folder between batches:
+        entries.csv       normalized_locality, latitude, longitude, uncertainty_m, grouper_id, source, added
+        vocabulary.json   tokens, their smoothed IDF and document frequencies
+        vectors.npz       entry × token TF-IDF (directional/numeric tokens ×1.10, then L2-normalized)
+        postings.npz      token × entry: the inverted token index
+    Queries are vectorized with the index's own vocabulary and IDF; tokens the index has never
+    seen still count in the query's norm, so similarities are true cosines.
+    """
+
+    ENTRY_COLUMNS = ['normalized_locality', 'latitude', 'longitude', 'uncertainty_m', 'grouper_id', 'source', 'added']
+
+    def __init__(self, folder, entries, tokens, idf, doc_freq, vectors, postings):
+        self.folder = folder
+        self.entries = entries
+        self.tokens = tokens
+        self.columns = {token: i for i, token in enumerate(tokens)}
+        self.idf = idf
+        self.doc_freq = doc_freq
+        self.vectors = vectors
+        self.postings = postings
+        self.stop_words = set(get_custom_stop_words())
+        important_phrases = set(get_important_phrases())
+        self.boost = np.array([1.10 if token in important_phrases or re.fullmatch(r'\d+(\.\d+)?', token) else 1.0
+                               for token in tokens])
+
+    @classmethod
+    def build(cls, folder, entries):
+        """Fit the vocabulary/IDF on the entries' texts and build their vectors and postings."""
+        from scipy.sparse import csr_matrix
+        entries = entries.reset_index(drop=True)
+        stop_words = set(get_custom_stop_words())
+        columns, rows, cols = {}, [], []
+        for row, text in enumerate(entries['normalized_locality']):
+            for token in analyze_locality(text, stop_words):
+                rows.append(row)
+                cols.append(columns.setdefault(token, len(columns)))
+        counts = csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(entries), len(columns)))
+        counts.sum_duplicates()
+        doc_freq = np.bincount(counts.indices, minlength=len(columns))
+        # same smoothed idf as TfidfVectorizer: ln((1 + n) / (1 + df)) + 1
+        idf = np.log((1 + len(entries)) / (1 + doc_freq)) + 1
+        index = cls(folder, entries, list(columns), idf, doc_freq, None, None)
+        index.vectors = index.weigh(counts)
+        index.postings = index.vectors.T.tocsr()
+        return index
+
+    @classmethod
+    def load(cls, folder):
+        """Raises FileNotFoundError/ValueError when the folder holds no readable index."""
+        from scipy.sparse import load_npz
+        if not os.path.isfile(os.path.join(folder, 'vocabulary.json')):
+            raise FileNotFoundError(f"No locality index in {folder}")
+        entries = pd.read_csv(os.path.join(folder, 'entries.csv'), dtype={'grouper_id': str, 'source': str},
+                              keep_default_na=False, na_values={'latitude': [''], 'longitude': [''], 'uncertainty_m': ['']})
+        with open(os.path.join(folder, 'vocabulary.json'), encoding='utf-8') as f:
+            vocabulary = json.load(f)
+        vectors = load_npz(os.path.join(folder, 'vectors.npz')).tocsr()
+        postings = load_npz(os.path.join(folder, 'postings.npz')).tocsr()
+        if vectors.shape != (len(entries), len(vocabulary['tokens'])) or postings.shape != vectors.shape[::-1]:
+            raise ValueError(f"Locality index in {folder} is inconsistent; rebuild it with --update-index")
+        return cls(folder, entries, vocabulary['tokens'], np.asarray(vocabulary['idf']),
+                   np.asarray(vocabulary['doc_freq']), vectors, postings)
+
+    def save(self):
+        """Write every part to a temporary file and rename it; vocabulary.json (checked by load) goes last."""
+        from scipy.sparse import save_npz
+        os.makedirs(self.folder, exist_ok=True)
+
+        def write(name, write_part, mode='wb'):
+            path = os.path.join(self.folder, name)
+            with open(path + '.tmp', mode) as f:
+                write_part(f)
+            os.replace(path + '.tmp', path)
+
+        write('entries.csv', lambda f: self.entries[self.ENTRY_COLUMNS].to_csv(f, index=False), mode='w')
+        write('vectors.npz', lambda f: save_npz(f, self.vectors))
+        write('postings.npz', lambda f: save_npz(f, self.postings))
+        vocabulary = {'tokens': self.tokens, 'idf': self.idf.tolist(), 'doc_freq': self.doc_freq.tolist()}
+        write('vocabulary.json', lambda f: json.dump(vocabulary, f), mode='w')
+
+    def weigh(self, counts, unseen_mass=None):
+        """Term counts → re-weighted, L2-normalized TF-IDF rows (unseen_mass: squared weight of unknown tokens per row)"""
+        from scipy.sparse import diags
+        weighted = counts.multiply(self.idf * self.boost).tocsr()
+        norms = np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel()
+        if unseen_mass is not None:
+            norms = norms + unseen_mass
+        norms = np.sqrt(norms)
+        return (diags(1 / np.where(norms > 0, norms, 1)) @ weighted).tocsr()
+
+    def transform(self, texts):
+        """Query texts as vectors over the index vocabulary (see the class docstring)."""
+        from scipy.sparse import csr_matrix
+        unseen_idf = np.log(1 + len(self.entries)) + 1
+        important_phrases = set(get_important_phrases())
+        rows, cols = [], []
+        unseen_mass = np.zeros(len(texts))
+        for row, text in enumerate(texts):
+            unseen = {}
+            for token in analyze_locality(text, self.stop_words):
+                col = self.columns.get(token)
+                if col is None:
+                    unseen[token] = unseen.get(token, 0) + 1
+                else:
+                    rows.append(row)
+                    cols.append(col)
+            for token, count in unseen.items():
+                boost = 1.10 if token in important_phrases or re.fullmatch(r'\d+(\.\d+)?', token) else 1.0
+                unseen_mass[row] += (count * unseen_idf * boost) ** 2
+        counts = csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(texts), len(self.tokens)))
+        counts.sum_duplicates()
+        return self.weigh(counts, unseen_mass)
+
+    def query(self, texts, min_similarity, max_postings=1000, chunk_size=4096):
+        """
+        Best entry per text with cosine ≥ min_similarity: (entry index or -1, similarity, number of entries ≥ min_similarity).
+        Candidates come from the postings of the text's rare tokens (≤ max_postings entries each) only:
+        an entry sharing none of them scores at most the norm of the text's common-token part, so texts
+        whose common part alone could reach min_similarity use every posting. Candidates are then scored exactly.
+        """
+        from scipy.sparse import diags
+        n = len(texts)
+        best = np.full(n, -1, dtype=np.int64)
+        best_similarity = np.zeros(n)
+        candidates = np.zeros(n, dtype=np.int64)
+        if n == 0 or len(self.entries) == 0:
+            return best, best_similarity, candidates
+
+        tolerance = 1e-9
+        common = self.doc_freq > max_postings
+        for start in range(0, n, chunk_size):
+            queries = self.transform(texts[start:start + chunk_size])
+            common_part = queries @ diags(common.astype(np.float64))
+            common_norm = np.sqrt(np.asarray(common_part.multiply(common_part).sum(axis=1)).ravel())
+            # rows whose rare tokens must find every entry ≥ min_similarity keep only those tokens;
+            # same tolerance as the score test below (an all-common text has norm 0.9999999999999999)
+            prune = common_norm < min_similarity - tolerance
+            rare_only = (diags(prune.astype(np.float64)) @ (queries - common_part)
+                         + diags((~prune).astype(np.float64)) @ queries)
+            pairs = (rare_only @ self.postings).tocoo()
+            if pairs.nnz == 0:
+                continue
+
+            scores = group_text_dots(self.vectors, queries, pairs.row, pairs.col)
+            keep = scores >= min_similarity - tolerance
+            rows, cols, scores = pairs.row[keep], pairs.col[keep], scores[keep]
+            if len(rows) == 0:
+                continue
+            np.add.at(candidates, start + rows, 1)
+            order = np.lexsort((cols, -np.round(scores, 12), rows))
+            first = order[np.r_[True, rows[order][1:] != rows[order][:-1]]]
+            best[start + rows[first]] = cols[first]
+            best_similarity[start + rows[first]] = scores[first]
+        return best, best_similarity, candidates
+
+
+def read_table(path, **kwargs):
+    """A .csv/.tsv (or a parquet/feather key) as a DataFrame; raises FileNotFoundError/ValueError."""
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"File not found: {path}")
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.parquet':
+        return pd.read_parquet(path)
+    if ext == '.feather':
+        return pd.read_feather(path)
+    if ext not in ('.csv', '.tsv'):
+        raise ValueError(f"Unsupported file type: {path}")
+    return pd.read_csv(path, sep='\t' if ext == '.tsv' else ',', encoding='utf-8-sig', **kwargs)
+
+
+def finalized_localities(key_path, coge_path):
+    """
+    Index entries from a reviewed batch: every normalized locality of the -key file whose
+    Grouper_ID has corrected coordinates in the From CoGe export (the newest verified row
+    per Grouper_ID when several). Group 0 (null localities) and blank texts are left out.
+    """
+    key = read_table(key_path, dtype=str, keep_default_na=False)
+    coge = read_table(coge_path, dtype=str, keep_default_na=False)
+    for column in ('Grouper_ID', 'normalized_locality'):
+        if column not in key.columns:
+            raise ValueError(f"{key_path} must contain a '{column}' column (a -key file).")
+    missing = [c for name, c in FROM_COGE_COLUMNS.items() if name != 'verified' and c not in coge.columns]
+    if missing:
+        raise ValueError(f"{coge_path} is missing column(s): {', '.join(missing)}")
+
+    reviewed = pd.DataFrame({
+        'grouper_id': coge[FROM_COGE_COLUMNS['grouper_id']].astype(str).str.strip(),
+        'latitude': pd.to_numeric(coge[FROM_COGE_COLUMNS['latitude']], errors='coerce'),
+        'longitude': pd.to_numeric(coge[FROM_COGE_COLUMNS['longitude']], errors='coerce'),
+        'uncertainty_m': pd.to_numeric(coge[FROM_COGE_COLUMNS['uncertainty_m']], errors='coerce'),
+    })
+    if FROM_COGE_COLUMNS['verified'] in coge.columns:
+        reviewed['verified'] = pd.to_datetime(coge[FROM_COGE_COLUMNS['verified']], errors='coerce', format='mixed')
+    else:
+        reviewed['verified'] = pd.NaT
+    reviewed = reviewed[reviewed['latitude'].between(-90, 90) & reviewed['longitude'].between(-180, 180)
+                        & ~reviewed['grouper_id'].isin(['', '0'])]
+    # newest verification wins; rows without a date count as oldest, file order breaks ties
+    reviewed = reviewed.sort_values('verified', kind='stable', na_position='first')
+    reviewed = reviewed.drop_duplicates('grouper_id', keep='last')
+
+    texts = pd.DataFrame({
+        'grouper_id': key['Grouper_ID'].astype(str).str.strip(),
+        'normalized_locality': key['normalized_locality'].astype(str).str.strip(),
+    })
+    texts = texts[texts['normalized_locality'] != ''].drop_duplicates()
+    entries = texts.merge(reviewed.drop(columns='verified'), on='grouper_id', how='inner')
+    entries['source'] = os.path.basename(coge_path)
+    entries['added'] = time.strftime('%Y-%m-%d')
+    return entries[LocalityIndex.ENTRY_COLUMNS]
+
+
+def update_locality_index(folder, key_path, coge_path):
+    """Add (or replace, by normalized locality) a reviewed batch's georeferences and rebuild the index."""
+    start_time = time.time()
+    new_entries = finalized_localities(key_path, coge_path)
+    try:
+        entries = pd.concat([LocalityIndex.load(folder).entries, new_entries], ignore_index=True)
+    except FileNotFoundError:
+        entries = new_entries
+    entries = entries.drop_duplicates('normalized_locality', keep='last')
+    index = LocalityIndex.build(folder, entries)
+    index.save()
+    print(f"Added {len(new_entries):,} finalized localities from {coge_path}; the index in {folder} now holds "
+          f"{len(index.entries):,} localities and {len(index.tokens):,} tokens ({time.time() - start_time:.2f} seconds).")
+    return index
+
+
+def attach_prior_georeferences(grouped, index, min_similarity=0.85):
+    """
+    Look up each group's Representative_Locality text in the locality index and attach the most
+    similar earlier georeference to every member: Prior_Locality/Latitude/Longitude/Uncertainty,
+    Prior_Similarity (0–100) and Prior_Candidates (index entries ≥ min_similarity). Group 0 is skipped.
+    """
+    start_time = time.time()
+    _, group_codes = np.unique(group_keys(grouped), return_inverse=True)
+    group_codes = group_codes.ravel()
+    representative_rows = np.flatnonzero(grouped['Is_Representative'].to_numpy()
+                                         & (grouped['Group_Base'].to_numpy() != 0))
+    texts = grouped['normalized_locality'].to_numpy()[representative_rows]
+    best, similarity, candidates = index.query(texts, min_similarity)
+
+    n_groups = int(group_codes.max()) + 1 if len(group_codes) else 0
+    group_best = np.full(n_groups, -1, dtype=np.int64)
+    group_similarity = np.full(n_groups, np.nan)
+    group_candidates = np.zeros(n_groups, dtype=np.int64)
+    codes = group_codes[representative_rows]
+    group_best[codes] = best
+    group_similarity[codes] = np.where(best >= 0, np.round(similarity * 100, 1), np.nan)
+    group_candidates[codes] = candidates
+
+    row_best = group_best[group_codes]
+    found = row_best >= 0
+    entries = index.entries
+    for column, source in (('Prior_Locality', 'normalized_locality'), ('Prior_Latitude', 'latitude'),
+                           ('Prior_Longitude', 'longitude'), ('Prior_Uncertainty', 'uncertainty_m')):
+        values = entries[source].to_numpy()[np.where(found, row_best, 0)] if len(entries) else np.full(len(grouped), None)
+        grouped[column] = pd.Series(values, index=grouped.index).where(found)
+    grouped['Prior_Similarity'] = group_similarity[group_codes]
+    grouped['Prior_Candidates'] = group_candidates[group_codes]
+    print(f"Matched {int((best >= 0).sum()):,} of {len(texts):,} groups to earlier georeferences "
+          f"(similarity ≥ {min_similarity}) in {time.time() - start_time:.2f} seconds.")
+    return grouped
+
+
+# --- Pipeline ---
+
+def prepare_localities(df, grouping_field, options, checkpoints=None, alias_map=None, report_base=None):
+    """
+    Steps 2–7a: preprocessing, alias discovery, duplicate collapsing, TF-IDF and optional rescoring.
+    With checkpoints each stage is saved after it runs, and with options.resume the stages up to
+    the latest valid checkpoint are loaded instead of run. A given alias_map replaces alias discovery.
+    With report_base (the input path without extension) the alias report is saved as
+    <report_base>-aliases.csv, and with options.profile_rules the rule profile as <report_base>-rules.csv.
+    Returns (grouped, directions, texts, id_matrix, rescored, groups_done); when groups_done,
+    texts already carries the group columns of a resumed grouping stage.
+    """
+    resumed_stage, saved = checkpoints.latest() if checkpoints and options.resume else (None, {})
+    if options.resume:
+        if resumed_stage is None:
+            print("No valid checkpoint for this input and these settings; starting from the beginning.")
+        else:
+            print(f"Resuming after the '{resumed_stage}' stage from {checkpoints.location}")
+
+    def resumed(stage):
+        return resumed_stage is not None and CHECKPOINT_STAGES.index(resumed_stage) >= CHECKPOINT_STAGES.index(stage)
 
     # 2) reprocess + extract distance/direction on unique rows
-    grouped = preprocess_localities(df, grouping_field)
+    if resumed('preprocess'):
+        grouped, directions = saved['grouped'], saved['directions']
+        if options.profile_rules:
+            print("Preprocessing was resumed from a checkpoint; no rule profile (run without --resume).")
+    else:
+        rules_report = report_base + '-rules.csv' if report_base else None
+        grouped, directions = preprocess_localities(df, grouping_field, options.profile_rules, rules_report)
+        if checkpoints:
+            checkpoints.save('preprocess', grouped=grouped, directions=directions)
+
+    if resumed('tfidf'):
+        texts, id_matrix = saved['texts'], saved['id_matrix']
+    else:
+        # 3) Token document frequencies: from the initial TF-IDF matrix, or streamed in hashing mode
+        # 4) Fuzzy alias discovery on the vocabulary
+        vectorizer = None if options.features == 'hashing' else make_tfidf_vectorizer()
+        if resumed('aliases'):
+            merged, alias_report = saved['aliases'], saved.get('alias_report')
+        else:
+            alias_report = None
+            if alias_map is not None:
+                merged = alias_map
+            else:
+                if options.features == 'hashing':
+                    token_freq = token_document_frequencies(grouped['normalized_locality'], options.feature_chunksize)
+                else:
+                    id_matrix, vectorizer = build_tfidf_matrix(grouped)
+                    token_freq = vocabulary_frequencies(id_matrix, vectorizer)
+                seed = load_alias_map(options.alias_map) if options.alias_map else None
+                decisions = []
+                merged = fuzzy_alias_tokens(token_freq, decisions, options.verbose, seed)
+                alias_report = alias_report_frame(decisions)
+                print(f"Found {len(merged):,} aliases among {len(token_freq):,} tokens.")
+            if checkpoints:
+                checkpoints.save('aliases', aliases=merged, alias_report=alias_report)
+        if report_base and alias_report is not None:
+            alias_file = report_base + '-aliases.csv'
+            alias_report.to_csv(alias_file, index=False)
+            print(f"Exported alias report to: {alias_file}")
+
+        # 5) Apply aliases to text
+        grouped['normalized_locality'] = grouped['normalized_locality'].apply(lambda t: apply_aliases(t, merged))
+
+        # 6) Collapse identical normalized localities to one representative text
+        texts = collapse_duplicate_texts(grouped, enabled=not options.no_dedup)
+
+        # 7) Rebuild TF-IDF on alias-applied unique texts and re-weight tokens
+        if options.features == 'hashing':
+            id_matrix = hashed_tfidf_matrix(texts, options.n_features, options.feature_chunksize)
+        else:
+            id_matrix = rebuild_tfidf_on_alias(texts, vectorizer)
+        if checkpoints:
+            checkpoints.save('tfidf', grouped=grouped, texts=texts, id_matrix=id_matrix)
+
+    # 7a) Optional: blend RapidFuzz token_set_ratio into borderline cosine pairs
+    rescored = saved.get('rescored')
+    if options.rescore and not resumed('groups'):
+        low, high = options.rescore
+        rescored = rescore_borderline_pairs(texts, id_matrix, low, high, options.rescore_weight, options.rescore_cutoff)
+
+    return grouped, directions, texts, id_matrix, rescored, resumed('groups')
+
+
+def group_with_options(df, grouping_field, options, checkpoints=None, alias_map=None, report_base=None):
+    """Steps 2–12 with an options namespace (see grouping_options); returns (grouped, directions)."""
+    grouped, directions, texts, id_matrix, rescored, groups_done = prepare_localities(
+        df, grouping_field, options, checkpoints, alias_map, report_base)
+
+    # 8) Group unique texts by cosine similarity → Suggested_ID/Group_Base, then broadcast to rows
+    # (components mode scores the later stages against the neighbor graph, not a dense matrix)
+    components = options.grouping == 'components'
+    if groups_done and components:
+        similarity = build_scoring_graph(id_matrix, min(options.threshold, options.singleton_similarity), rescored)
+    elif groups_done:
+        similarity = compute_similarity(id_matrix, options.similarity_dtype, options.similarity_memmap)
+    else:
+        texts, similarity = group_by_similarity(texts, id_matrix, threshold=options.threshold,
+                                                method=options.grouping, max_diameter=options.max_diameter,
+                                                similarity_dtype=options.similarity_dtype,
+                                                scratch_dir=options.similarity_memmap, rescored=rescored,
+                                                singleton_similarity=options.singleton_similarity)
+    similarity_file = scratch_file(similarity)
+    try:
+        if groups_done and not components and rescored is not None:
+            similarity = apply_rescored_similarity(similarity, rescored)
+        if checkpoints and not groups_done:
+            checkpoints.save('groups', texts=texts, rescored=rescored)
+        grouped = broadcast_text_groups(grouped, texts)
+
+        # 9) Directional splits (subgroup IDs like 12.1, 12.2)
+        grouped = validate_directional_splits(grouped)
+
+        # 10) Null/placeholder localities → group 0
+        grouped = set_null_groups_to_zero(grouped)
+
+        # 11) Confidence score per record (avg intra-group similarity × 100)
+        if components:
+            grouped = assign_centroid_confidence(grouped, id_matrix, rescored)
+        else:
+            grouped = assign_confidence_scores(grouped, similarity)
+
+        # 11a) Representative (medoid) locality of each group
+        grouped = assign_representatives(grouped, id_matrix)
+
+        # 11b) Closest earlier georeference per group from the locality index
+        if options.locality_index:
+            index = LocalityIndex.load(options.locality_index)
+            grouped = attach_prior_georeferences(grouped, index, options.prior_similarity)
+
+        # 12) Place singleton groups after the most similar non-singleton group
+        singleton_inserts = reorder_similar_singletons(grouped, similarity, options.singleton_similarity)
+        grouped = assign_sort_keys(grouped, singleton_inserts)
+    finally:
+        del similarity
+        release_scratch_file(similarity_file)
+
+    return grouped, directions
+
+
+def sweep_with_options(df, grouping_field, options, checkpoints=None, alias_map=None, report_base=None):
+    """Steps 2–7a, then the threshold sweep report for options.sweep."""
+    grouped, _, _, id_matrix, rescored, _ = prepare_localities(
+        df, grouping_field, options, checkpoints, alias_map, report_base)
+    return threshold_sweep(grouped, id_matrix, options.sweep, options.grouping, options.max_diameter,
+                           options.singleton_similarity, rescored)
+
+
+def run_file(df, csv_path, grouping_field, options, checkpoints=None, alias_map=None):
+    """
+    One input file end to end: the threshold sweep report with options.sweep, otherwise grouping
+    and the key export. Returns (output file, summary dict).
+    """
+    report_base = os.path.splitext(csv_path)[0]
+    if options.sweep is not None:
+        report = sweep_with_options(df, grouping_field, options, checkpoints, alias_map, report_base)
+        report_file = report_base + '-sweep.csv'
+        report.to_csv(report_file, index=False)
+        print(report.to_string(index=False))
+        print(f"Exported threshold sweep to: {report_file}")
+        return report_file, {'thresholds': len(report)}
+
+    grouped, directions = group_with_options(df, grouping_field, options, checkpoints, alias_map, report_base)
+    output_file = export_grouped_csv(grouped, directions, df, csv_path, grouping_field,
+                                     options.output_format, options.write_merged)
+    return output_file, {'records': len(grouped), 'groups': int(np.unique(group_keys(grouped)).size)}
+
+
+# --- Importable API ---
+
+def group_localities(df, grouping_field=GROUPING_FIELD, checkpoints=None, **options):
+    """
+    Group the localities of a DataFrame with 'locality' and grouping_field columns, e.g.
+        grouped, directions = grouper.group_localities(df, threshold=0.8, grouping='components')
+    options are the command line options as keywords (see grouping_options). Never prompts or
+    exits: invalid options or missing columns raise ValueError.
+    Returns (grouped, directions): one row per grouping_field value with Suggested_ID,
+    Group_Base/Group_Sub, Confidence, Representative_Locality/Is_Representative and the sort keys,
+    and its DistanceDirections table;
+    build_key_table(grouped, directions) gives the -key table.
+    """
+    options = grouping_options(**options)
+    check_columns(df, grouping_field)
+    return group_with_options(df, grouping_field, options, checkpoints)
+
+
+def sweep_localities(df, thresholds, grouping_field=GROUPING_FIELD, checkpoints=None, **options):
+    """Threshold sweep report (see threshold_sweep) for a DataFrame, with the same options as group_localities."""
+    options = grouping_options(sweep=thresholds, **options)
+    check_columns(df, grouping_field)
+    return sweep_with_options(df, grouping_field, options, checkpoints)
+
+
+# --- Batch mode ---
+
+OUTPUT_SUFFIXES = ('-key', '-grouped', '-sweep', '-merged', '-rules', '-aliases')
+BATCH_REPORT_PREFIX = 'grouper-batch-'
+
+
+def is_batch_input(csv_path):
+    return os.path.isdir(csv_path) or any(ch in csv_path for ch in '*?[')
+
+
+def batch_inputs(csv_path):
+    """.csv/.tsv inputs in a folder or matching a glob (our own output files and batch reports excluded), largest first."""
+    pattern = os.path.join(csv_path, '*') if os.path.isdir(csv_path) else csv_path
+    paths = [
+        path for path in glob.glob(pattern)
+        if os.path.isfile(path)
+        and os.path.splitext(path)[1].lower() in ('.csv', '.tsv')
+        and not os.path.splitext(path)[0].endswith(OUTPUT_SUFFIXES)
+        and not os.path.basename(path).startswith(BATCH_REPORT_PREFIX)
+    ]
+    return sorted(paths, key=lambda path: (-os.path.getsize(path), path))
+
+
+def batch_folder(csv_path, paths):
+    """Where batch-level reports go: the input folder, or the common folder of the glob's matches."""
+    return csv_path if os.path.isdir(csv_path) else os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
 
-    # 3) Fuzzy alias discovery based on initial matrix
-    id_matrix, vectorizer = build_tfidf_matrix(grouped)
 
-    # 4) Apply aliases to text
-    merged = fuzzy_alias_tokens(id_matrix, vectorizer)
+def batch_token_frequencies(csv_path, grouping_field, options):
+    """Batch worker, shared-alias pass: token document frequencies of one file's preprocessed localities."""
+    df, _ = read_input_file(csv_path, grouping_field)
+    checkpoints = Checkpoints(csv_path, checkpoint_settings(options)) if use_checkpoints(options) else None
+    resumed_stage, saved = checkpoints.latest() if checkpoints and options.resume else (None, {})
+    if resumed_stage is not None:
+        grouped = saved['grouped'] if resumed_stage in ('preprocess', 'aliases') else None
+    if resumed_stage is None or grouped is None:
+        rules_report = os.path.splitext(csv_path)[0] + '-rules.csv' if options.profile_rules else None
+        grouped, directions = preprocess_localities(df, grouping_field, options.profile_rules, rules_report)
+        if checkpoints:
+            checkpoints.save('preprocess', grouped=grouped, directions=directions)
+    return token_document_frequencies(grouped['normalized_locality'], options.feature_chunksize)
 
-    # 5) Apply aliases to text
-    grouped['normalized_locality'] = grouped['normalized_locality'].apply(lambda t: apply_aliases(t, merged))
 
-    # 6) Rebuild TF-IDF on alias-applied text and re-weight tokens
-    id_matrix = rebuild_tfidf_on_alias(grouped, vectorizer)
+def batch_group_file(csv_path, grouping_field, options, alias_map=None):
+    """Batch worker: group (or sweep) one file; failures are reported in the summary instead of raised."""
+    start_time = time.time()
+    row = {'file': csv_path, 'size_mb': round(os.path.getsize(csv_path) / 2 ** 20, 2)}
+    try:
+        df, _ = read_input_file(csv_path, grouping_field)
+        checkpoints = Checkpoints(csv_path, checkpoint_settings(options, alias_map)) if use_checkpoints(options) else None
+        output_file, summary = run_file(df, csv_path, grouping_field, options, checkpoints, alias_map)
+        row.update(status='ok', output_file=output_file, **summary)
+    except Exception as e:
+        row.update(status=f"failed: {type(e).__name__}: {e}")
+    row['seconds'] = round(time.time() - start_time, 2)
+    return row
+
+
+def run_batch(csv_path, grouping_field, options):
+    """
+    Batch mode: group every .csv/.tsv in a folder or glob on a process pool, largest files first so
+    the longest jobs start early, then write grouper-batch-summary.csv next to the inputs.
+    With options.shared_aliases one alias map is learned from all files' token frequencies first
+    (with --checkpoint each file's preprocessing is saved, so the grouping pass picks it up).
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
 
-    # 7) Group by cosine similarity → Suggested_ID/Grouper_ID
-    grouped, similarity = group_by_similarity(grouped, id_matrix)
+    paths = batch_inputs(csv_path)
+    if not paths:
+        print(f"No .csv/.tsv files found for: {csv_path}")
+        sys.exit(1)
+
+    workers = min(options.workers or min(DEFAULT_BATCH_WORKERS, os.cpu_count() or 1), len(paths))
+    start_time = time.time()
+    print(f"Batch: {len(paths):,} files on {workers} worker(s), largest first.")
+
+    alias_map = None
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if options.shared_aliases:
+            futures = {path: pool.submit(batch_token_frequencies, path, grouping_field, options) for path in paths}
+            token_freq = {}
+            # merge in file name order so the alias map doesn't depend on completion order
+            for path in sorted(futures):
+                try:
+                    file_freq = futures[path].result()
+                except Exception as e:
+                    print(f"Skipping {path} for the shared alias map: {type(e).__name__}: {e}")
+                    continue
+                for token, freq in file_freq.items():
+                    token_freq[token] = token_freq.get(token, 0) + freq
+            seed = load_alias_map(options.alias_map) if options.alias_map else None
+            decisions = []
+            alias_map = fuzzy_alias_tokens(token_freq, decisions, options.verbose, seed)
+            alias_file = os.path.join(batch_folder(csv_path, paths), BATCH_REPORT_PREFIX + 'aliases.csv')
+            alias_report_frame(decisions).to_csv(alias_file, index=False)
+            print(f"Learned {len(alias_map):,} shared aliases from {len(token_freq):,} tokens "
+                  f"in {time.time() - start_time:.2f} seconds; report: {alias_file}")
+            if use_checkpoints(options):
+                # a copy: the caller's namespace keeps its own resume setting
+                options = argparse.Namespace(**vars(options))
+                options.resume = True
+
+        futures = [pool.submit(batch_group_file, path, grouping_field, options, alias_map) for path in paths]
+        rows = []
+        for done, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            rows.append(row)
+            print(f"[{done}/{len(paths)}] {row['seconds']:>8.2f}s  {row['file']}  {row['status']}")
+
+    order = {path: i for i, path in enumerate(paths)}
+    report = pd.DataFrame(sorted(rows, key=lambda row: order[row['file']]))
+    for column in ('records', 'groups', 'thresholds'):
+        if column in report.columns:
+            report[column] = report[column].astype('Int64')
+    report_file = os.path.join(batch_folder(csv_path, paths), BATCH_REPORT_PREFIX + 'summary.csv')
+    report.to_csv(report_file, index=False)
+
+    failed = int((report['status'] != 'ok').sum())
+    print(f"\nGrouped {len(paths) - failed:,} of {len(paths):,} files in {time.time() - start_time:.2f} seconds "
+          f"({report['seconds'].sum():.2f} seconds of work on {workers} worker(s)).")
+    if failed:
+        print(f"{failed:,} file(s) failed; see the status column.")
+    print(f"Exported batch summary to: {report_file}")
+    return report
+
+
+# --- Job server ---
+
+def serve(port, grouping_field=GROUPING_FIELD, token=None):
+    """
+    Local HTTP job server on 127.0.0.1: the libraries, compiled patterns and each file's stage
+    results (see WarmCheckpoints) stay loaded between jobs, so a repeat job on the same file
+    only reruns the stages after the first changed setting. Jobs run one at a time.
+        POST /group   {"csv_path": "...", <options as in grouping_options>}
+                      → {"output_file": ..., "seconds": ..., "records"/"groups" or "thresholds": ...}
+        GET  /health  → {"status": "ok", "jobs": <jobs completed>}
+    Jobs must be sent as Content-Type: application/json with the token in an X-Grouper-Token header,
+    and requests carrying an Origin header are refused: a web page open in a browser could otherwise
+    post jobs that read local files and write next to them.
+    """
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from collections import OrderedDict
+    import traceback
+    import secrets
+    import hmac
+
+    token = token or secrets.token_urlsafe(24)
+
+    store = OrderedDict()
+    completed = [0]
+
+    class JobHandler(BaseHTTPRequestHandler):
+        def reply(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path != '/health':
+                return self.reply(404, {'error': f"unknown path {self.path}"})
+            self.reply(200, {'status': 'ok', 'jobs': completed[0]})
+
+        def do_POST(self):
+            if self.path != '/group':
+                return self.reply(404, {'error': f"unknown path {self.path}"})
+            if self.headers.get('Origin') is not None:
+                return self.reply(403, {'error': "requests from web pages are not accepted"})
+            if not hmac.compare_digest(self.headers.get('X-Grouper-Token', '').encode(), token.encode()):
+                return self.reply(403, {'error': "missing or wrong X-Grouper-Token header"})
+            content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if content_type != 'application/json':
+                return self.reply(415, {'error': "Content-Type must be application/json"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if not isinstance(body, dict):
+                    raise ValueError("the request body must be a JSON object")
+                csv_path = body.pop('csv_path', None)
+                if not csv_path:
+                    raise ValueError("csv_path is required")
+                options = grouping_options(**body)
+                if options.output_format != 'csv':
+                    import pyarrow  # noqa: F401
+                df, _ = read_input_file(csv_path, grouping_field)
+            except (ValueError, TypeError, OSError, ImportError) as e:
+                return self.reply(400, {'error': str(e)})
+
+            start_time = time.time()
+            # stage results stay in memory (bounded, never on disk), so every job resumes from them
+            checkpoints = WarmCheckpoints(csv_path, checkpoint_settings(options), store)
+            options.resume = True
+            try:
+                output_file, summary = run_file(df, csv_path, grouping_field, options, checkpoints)
+            except Exception as e:
+                traceback.print_exc()
+                return self.reply(500, {'error': f"{type(e).__name__}: {e}"})
+            completed[0] += 1
+            self.reply(200, {'output_file': output_file, 'seconds': round(time.time() - start_time, 2), **summary})
+
+    server = HTTPServer(('127.0.0.1', port), JobHandler)
+    print(f"Serving grouping jobs on http://127.0.0.1:{port} (POST /group, GET /health); Ctrl+C to stop.")
+    print(f"Send jobs with the header X-Grouper-Token: {token}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
 
-    # 8) Directional splits (subgroup IDs like 12.1, 12.2)
-    grouped = validate_directional_splits(grouped)
 
-    # 9) Null/placeholder localities → Grouper_ID = '0'
-    grouped = set_null_groups_to_zero(grouped)
+def grouper_main():
+    """master function which runs all methods above in the necessary order"""
+    grouping_field = GROUPING_FIELD
+
+    args = parse_args(grouping_field)
+    if args.serve is not None:
+        serve(args.serve, grouping_field, args.serve_token)
+        return
+    if args.update_index:
+        try:
+            update_locality_index(args.locality_index, *args.update_index)
+        except (OSError, ValueError) as e:
+            print(e)
+            sys.exit(1)
+        return
+    require_pyarrow(args.output_format)
+
+    # Batch mode: a folder or glob of inputs
+    if args.csv_path and is_batch_input(args.csv_path):
+        run_batch(args.csv_path, grouping_field, args)
+        return
 
-    # 10) Confidence score per record (avg intra-group similarity × 100)
-    grouped = assign_confidence_scores(grouped, similarity)
+    # 1) read in input csv
+    df, sep, csv_path = load_input_csv(grouping_field, args.csv_path)
 
-    # 11) Place singleton groups after the most similar non-singleton group
-    singleton_inserts = reorder_similar_singletons(grouped, similarity)
+    checkpoints = Checkpoints(csv_path, checkpoint_settings(args)) if use_checkpoints(args) else None
 
-    # 12) export csvs
-    export_grouped_csv(grouped, df, csv_path, grouping_field, singleton_inserts)
+    # 2–13) group (or sweep) and export
+    run_file(df, csv_path, grouping_field, args, checkpoints)
 
 
 if __name__ == '__main__':
-    grouper_main()
\ No newline at end of file
+    grouper_main()
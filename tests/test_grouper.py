@@ -0,0 +1,173 @@
+import random
+
+import pandas as pd
+import pytest
+
+import grouper
+
+COMMON = ["roadside", "pasture", "creekbank", "woodland", "grassland", "floodplain"]
+PLACES = ["pilot point city park", "lewisville lake dam spillway", "greenbelt corridor near aubrey",
+          "isle du bois unit state park", "clear creek natural heritage center", "sanger city limits"]
+# unrelated localities; the habitat words they share get a low document frequency weight
+FILLER = [f"{place} {COMMON[(i + i // 6) % 6]} {COMMON[(i + i // 6 + 2) % 6]} {COMMON[(i + 4) % 6]}"
+          for i, place in enumerate(PLACES * 3)]
+
+# same tokens in another order ("on" is a stop word): cosine 1.0, merged with or without rescoring
+REORDERED = ["5 miles north of denton on highway 77", "highway 77, 5 miles north of denton"]
+# reordered and extended: cosine about 0.83, below the 0.85 threshold, token_set_ratio 100
+EXTENDED = ["3 miles south of krum on farm road 156 near the old bridge", "farm road 156, 3 miles south of krum"]
+# only the numbers in common: cosine about 0.87, token_set_ratio about 70
+# a chain: each text is similar to the next but the ends are not, so greedy grouping depends on row order
+CHAIN_WORDS = "caddo hagerman mustang pecan sandbar willow cottonwood levee slough oxbow tanglewood bluestem".split()
+CHAIN = [" ".join(CHAIN_WORDS[i:i + 10]) for i in range(3)]
+NUMBERS_ONLY = ["4512 7730 8841 6603 roadside pasture", "4512 7730 8841 6603 woodland grassland"]
+
+
+def synthetic_localities(n=120, seed=7):
+    """
+    Distance/direction localities around a few towns, with exact, case and punctuation duplicates
+    and near variants (an extra habitat word).
+    """
+    rng = random.Random(seed)
+    towns = ["denton", "krum", "sanger", "aubrey", "pilot point", "decatur"]
+    roads = ["highway 77", "fm 156", "us 380", "fm 455", "state highway 114"]
+    directions = ["north", "south", "east", "west", "ne", "sw"]
+    localities = []
+    while len(localities) < n:
+        locality = (f"{rng.randint(1, 12)} mi {rng.choice(directions)} of {rng.choice(towns)} "
+                    f"on {rng.choice(roads)}")
+        localities.append(locality)
+        if rng.random() < 0.3:
+            localities.append(locality.upper())
+        if rng.random() < 0.2:
+            localities.append(locality.replace(" on ", ", on ") + ".")
+        if rng.random() < 0.3:
+            localities.append(f"{locality} {rng.choice(COMMON)}")
+    localities += CHAIN + ["", "no locality data", PLACES[0], PLACES[0]]
+    return localities
+
+
+@pytest.fixture
+def locality_csv(tmp_path):
+    path = tmp_path / "occurrences.csv"
+    localities_frame(synthetic_localities()).to_csv(path, index=False)
+    return str(path)
+
+
+def read_localities(csv_path):
+    df, _ = grouper.read_input_file(csv_path, grouper.GROUPING_FIELD)
+    return df
+
+
+def key_table(grouped, directions):
+    return grouper.build_key_table(grouped, directions).reset_index(drop=True)
+
+
+def localities_frame(localities):
+    return pd.DataFrame({
+        'locality': localities,
+        'bels_location_id': [str(1000 + i) for i in range(len(localities))],
+    })
+
+
+def group_of(grouped, locality):
+    return grouped.loc[grouped['locality'] == locality, 'Suggested_ID'].item()
+
+
+def same_group(grouped, pair):
+    return group_of(grouped, pair[0]) == group_of(grouped, pair[1])
+
+
+def test_rescore_merges_reordered_wording_and_splits_numbers_only_overlap():
+    df = localities_frame(REORDERED + EXTENDED + NUMBERS_ONLY + FILLER)
+
+    plain, _ = grouper.group_localities(df)
+    assert same_group(plain, REORDERED)
+    assert not same_group(plain, EXTENDED)
+    assert same_group(plain, NUMBERS_ONLY)
+
+    rescored, _ = grouper.group_localities(df, rescore=(0.70, 0.90))
+    assert same_group(rescored, REORDERED)
+    assert same_group(rescored, EXTENDED)
+    assert not same_group(rescored, NUMBERS_ONLY)
+
+
+def test_collapsed_duplicates_match_no_dedup(locality_csv):
+    df = read_localities(locality_csv)
+    collapsed = key_table(*grouper.group_localities(df))
+    uncollapsed = key_table(*grouper.group_localities(df, no_dedup=True))
+    pd.testing.assert_frame_equal(collapsed, uncollapsed)
+
+
+def partition(grouped):
+    """Groups as sets of bels_location_ids, whatever their numbers."""
+    members = {}
+    for record, group in zip(grouped[grouper.GROUPING_FIELD], grouper.group_keys(grouped)):
+        members.setdefault(group, set()).add(record)
+    return {frozenset(records) for records in members.values()}
+
+
+@pytest.mark.parametrize("max_diameter", [None, 2])
+def test_components_ignore_row_order(locality_csv, max_diameter):
+    # bels_location_ids are unique, so preprocessing keeps the same rows in any order
+    df = read_localities(locality_csv)
+    shuffled = df.sample(frac=1, random_state=3).reset_index(drop=True)
+    options = {'grouping': 'components', 'max_diameter': max_diameter}
+    grouped, _ = grouper.group_localities(df, **options)
+    reshuffled, _ = grouper.group_localities(shuffled, **options)
+    assert partition(reshuffled) == partition(grouped)
+
+
+@pytest.mark.parametrize("grouping", ["greedy", "components"])
+def test_resumed_run_matches_fresh_run(locality_csv, grouping, capsys):
+    df = read_localities(locality_csv)
+
+    def run(checkpoints=True, **options):
+        options = grouper.grouping_options(grouping=grouping, rescore=(0.70, 0.90), **options)
+        if checkpoints:
+            checkpoints = grouper.Checkpoints(locality_csv, grouper.checkpoint_settings(options))
+        return key_table(*grouper.group_with_options(df, grouper.GROUPING_FIELD, options, checkpoints or None))
+
+    fresh = run(checkpoint=True)
+    capsys.readouterr()
+    resumed = run(resume=True)
+    assert "Resuming after the 'groups' stage" in capsys.readouterr().out
+    pd.testing.assert_frame_equal(resumed, fresh)
+
+    # a changed threshold reruns the grouping from the saved TF-IDF stage
+    resumed = run(resume=True, threshold=0.8)
+    assert "Resuming after the 'tfidf' stage" in capsys.readouterr().out
+    pd.testing.assert_frame_equal(resumed, run(checkpoints=False, threshold=0.8))
+
+
+def reviewed_batch(tmp_path, name, localities, coordinates):
+    """-key and From CoGe files of a reviewed batch: every group gets the coordinates of its first member."""
+    key = key_table(*grouper.group_localities(localities_frame(localities)))
+    key_path = tmp_path / f"{name}-key.csv"
+    key.to_csv(key_path, index=False)
+    first = key.drop_duplicates('Grouper_ID')
+    first = first[first['Grouper_ID'] != '0']
+    coge = pd.DataFrame({
+        'Grouper_ID': first['Grouper_ID'],
+        'Corrected latitude': [coordinates[text][0] for text in first['locality']],
+        'Corrected longitude': [coordinates[text][1] for text in first['locality']],
+        'Corrected uncertainty radius': 500,
+    })
+    coge_path = tmp_path / f"{name}-fromcoge.csv"
+    coge.to_csv(coge_path, index=False)
+    return str(key_path), str(coge_path)
+
+
+def test_index_finds_just_added_locality(tmp_path):
+    folder = str(tmp_path / "index")
+    first = {REORDERED[0]: (33.29, -97.13), PLACES[1]: (33.07, -96.96)}
+    grouper.update_locality_index(folder, *reviewed_batch(tmp_path, "first", list(first), first))
+    second = {EXTENDED[0]: (33.36, -97.19)}
+    grouper.update_locality_index(folder, *reviewed_batch(tmp_path, "second", list(second), second))
+
+    grouped, _ = grouper.group_localities(localities_frame([EXTENDED[0], PLACES[2]]), locality_index=folder)
+    match = grouped.set_index('locality').loc[EXTENDED[0]]
+    assert match['Prior_Similarity'] == 100
+    assert match['Prior_Latitude'] == 33.36
+    assert grouped.set_index('locality').loc[PLACES[2], 'Prior_Candidates'] == 0
+    assert len(grouper.LocalityIndex.load(folder).entries) == 3
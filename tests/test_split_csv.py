@@ -0,0 +1,82 @@
+import csv
+import os
+import shutil
+
+import pytest
+
+import SplitCSVbyInstitution as split
+
+# stray quotes inside unquoted fields, a quoted newline, blank lines, a row of empty fields,
+# a short row and CRLF line ends
+SAMPLE = (
+    'institutionCode,collectionCode,locality,id_score\r\n'
+    'TAES,Herb,5" north of road,1\r\n'
+    'TAES,Herb,"bridge over\r\nthe ""old"" creek",1\r\n'
+    '\r\n'
+    ',,,\r\n'
+    'BRIT,,2 mi. W of 6" pipe,1\r\n'
+    'TAES,,dropped by id_score,0\r\n'
+    'BRIT,Vasc,short row\r\n'
+    '\r\n'
+    'TAES,Herb,"last, quoted",1\r\n'
+    'BRIT,,no line end,1'
+)
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def outputs(directory, input_name):
+    return {name: read_rows(os.path.join(directory, name))
+            for name in sorted(os.listdir(directory)) if name != input_name and not name.endswith(split.INDEX_SUFFIX)}
+
+
+def test_index_extract_matches_full_split(tmp_path, capsys):
+    full_dir, index_dir = tmp_path / "full", tmp_path / "index"
+    full_dir.mkdir()
+    index_dir.mkdir()
+    (full_dir / "export.csv").write_bytes(SAMPLE.encode("utf-8"))
+    shutil.copy(full_dir / "export.csv", index_dir / "export.csv")
+
+    split.split_csv_by_combo(str(full_dir / "export.csv"))
+    full_out = capsys.readouterr().out
+    split.extract_from_index(str(index_dir / "export.csv"), ["TAES", "BRIT"])
+    index_out = capsys.readouterr().out
+
+    expected = outputs(full_dir, "export.csv")
+    assert set(expected) == {"export_taes-herb.csv", "export_brit.csv"}
+    assert outputs(index_dir, "export.csv") == expected
+    assert expected["export_taes-herb.csv"][1:] == [
+        ["TAES", "Herb", '5" north of road', "1"],
+        ["TAES", "Herb", 'bridge over\r\nthe "old" creek', "1"],
+        ["TAES", "Herb", "last, quoted", "1"],
+    ]
+    # both count the blank lines, the empty fields and the short row as malformed
+    for out in (full_out, index_out):
+        assert "Total data rows (excluding header): 10" in out
+        assert "Malformed/skipped rows (column count mismatch or blank): 4" in out
+
+
+def test_pyarrow_engine_matches_csv_engine(tmp_path, capsys):
+    pytest.importorskip("pyarrow")
+    csv_dir, arrow_dir = tmp_path / "csv", tmp_path / "arrow"
+    csv_dir.mkdir()
+    arrow_dir.mkdir()
+    # plus an institution and a locality that are not valid UTF-8
+    data = SAMPLE.encode("utf-8") + b"\r\nTA\xe9S,Herb,caf\xe9 road,1\r\n"
+    (csv_dir / "export.csv").write_bytes(data)
+    (arrow_dir / "export.csv").write_bytes(data)
+
+    split.split_csv_by_combo(str(csv_dir / "export.csv"))
+    csv_out = capsys.readouterr().out
+    split.split_csv_by_combo_arrow(str(arrow_dir / "export.csv"))
+    arrow_out = capsys.readouterr().out
+
+    names = sorted(os.listdir(csv_dir))
+    assert sorted(os.listdir(arrow_dir)) == names
+    for name in names:
+        assert (arrow_dir / name).read_bytes() == (csv_dir / name).read_bytes(), name
+    assert arrow_out == csv_out
+    assert "Malformed/skipped rows (column count mismatch or blank): 4" in arrow_out